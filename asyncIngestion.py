@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import logging
+from concurrent.futures import Future
+from metrics import recordStage
+from config import asyncConnections, asyncConnectionsPerHost, asyncMaxDownloads, asyncQueueSize ## importing from config.py
+from config import httpConnectTimeout, httpReadTimeout, httpRetries, httpBackoff, spoolThreshold
+
+## statuses worth retrying, same as the requests session in httpClient.py
+retryStatuses = (429, 500, 502, 503, 504)
+
+
+## class downloading urls on an asyncio event loop and handing the pdfs to the pipeline engine
+class AsyncUrlIngester:
+    """
+    downloads run concurrently on one event loop thread with a connection limit per host,
+    so hundreds of slow urls do not each hold a thread.
+    downloaded pdfs go through a bounded queue to the engine's process pool, so network
+    latency and extraction/summarisation overlap, and downloads pause while the queue is full.
+    aiohttp is optional (pip install aiohttp), start() raises ImportError without it.
+    example(how to use):
+    with PipelineEngine() as engine, AsyncUrlIngester(engine) as ingester:
+        future = ingester.submit(url) ## resolved once the document is persisted
+    """
+    def __init__(self, engine, controller=None, connections=asyncConnections, connectionsPerHost=asyncConnectionsPerHost,
+                 maxDownloads=asyncMaxDownloads, queueSize=asyncQueueSize):
+        self.engine = engine
+        self.controller = controller ## AdmissionController bounding documents in the engine, None admits everything
+        self.connections = connections
+        self.connectionsPerHost = connectionsPerHost
+        self.queueSize = queueSize
+        self.downloadSlots = threading.BoundedSemaphore(maxDownloads) ## submit blocks while every slot is taken
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.queue = None
+        self.handoffTask = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    ## start the event loop thread and open the http session on it
+    def start(self):
+        import aiohttp ## optional dependency, imported here so the rest of the pipeline runs without it
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="asyncIngestion", daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.open(aiohttp), self.loop).result()
+        logging.info(f"Started async url ingestion with {self.connections} connections, {self.connectionsPerHost} per host.")
+
+    async def open(self, aiohttp):
+        connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connectionsPerHost)
+        timeout = aiohttp.ClientTimeout(sock_connect=httpConnectTimeout, sock_read=httpReadTimeout)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self.queue = asyncio.Queue(maxsize=self.queueSize)
+        self.handoffTask = asyncio.ensure_future(self.handoff())
+
+    ## queue a url, called from any thread, returns a future resolved once the document is persisted
+    def submit(self, url):
+        self.downloadSlots.acquire() ## backpressure on the caller when too many downloads are running
+        result = Future()
+        asyncio.run_coroutine_threadsafe(self.download(url, result), self.loop)
+        return result
+
+    ## download one url and put it on the handoff queue
+    async def download(self, url, result):
+        try:
+            startTime = time.perf_counter()
+            kind, data = await self.fetch(url)
+            recordStage("download", time.perf_counter()-startTime)
+        except Exception as e:
+            logging.error(f"Error downloading {url}: {e}")
+            self.downloadSlots.release()
+            result.set_exception(e)
+            return
+
+        await self.queue.put((url, kind, data, result)) ## waits while the engine is behind
+        self.downloadSlots.release()
+
+    ## stream a url into memory or a spool file, retrying connection errors and 429/5xx responses
+    async def fetch(self, url):
+        for attempt in range(httpRetries+1):
+            try:
+                async with self.session.get(url) as response:
+                    if response.status in retryStatuses and attempt < httpRetries:
+                        raise RetryableStatus(response.status)
+                    response.raise_for_status() ## check for http errors
+                    return await self.readBody(response)
+            except Exception as e:
+                if attempt == httpRetries or not isRetryable(e):
+                    raise
+                delay = httpBackoff*(2**attempt)
+                logging.warning(f"Retrying {url} in {delay} seconds after: {e}")
+                await asyncio.sleep(delay)
+
+    ## read the body like httpClient.downloadToSpool, large bodies go to a temporary file
+    async def readBody(self, response):
+        buffer = bytearray()
+        spool = None
+        try:
+            async for chunk in response.content.iter_chunked(64*1024):
+                if spool is not None:
+                    spool.write(chunk)
+                    continue
+                buffer.extend(chunk)
+                if len(buffer) > spoolThreshold:
+                    spool = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+                    spool.write(buffer)
+                    buffer = None
+        except Exception:
+            if spool is not None:
+                spool.close()
+                os.remove(spool.name)
+            raise
+
+        if spool is None:
+            return "memory", bytes(buffer)
+        spool.close()
+        return "file", spool.name
+
+    ## hand downloaded pdfs to the engine, admitting each one through the controller
+    async def handoff(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            url, kind, data, result = item
+            size = os.path.getsize(data) if kind == "file" else len(data)
+            if self.controller:
+                ## acquire blocks, so it waits on an executor thread instead of the event loop
+                await self.loop.run_in_executor(None, self.controller.acquire, size)
+
+            try:
+                future = self.engine.submitDownload(url, kind, data)
+            except Exception as e:
+                logging.error(f"Error submitting {url}: {e}")
+                if self.controller:
+                    self.controller.release(size)
+                result.set_exception(e)
+                continue
+            future.add_done_callback(lambda f, result=result, size=size: self.onProcessed(f, result, size))
+
+    def onProcessed(self, future, result, size):
+        if self.controller:
+            self.controller.release(size)
+        try:
+            result.set_result(future.result())
+        except Exception as e:
+            result.set_exception(e)
+
+    ## stop after every queued download has been handed to the engine
+    def close(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        logging.info("Async url ingestion stopped.")
+
+    async def shutdown(self):
+        await self.queue.put(None)
+        await self.handoffTask
+        await self.session.close()
+
+
+## raised for a response status that should be retried
+class RetryableStatus(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+## function to decide if a download error is worth retrying
+def isRetryable(error):
+    import aiohttp
+    return isinstance(error, (RetryableStatus, aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+## function returning a started ingester, or None when aiohttp is not installed
+def createUrlIngester(engine, controller=None):
+    ingester = AsyncUrlIngester(engine, controller)
+    try:
+        ingester.start()
+    except ImportError:
+        logging.warning("aiohttp is not installed, urls are downloaded on the engine's workers.")
+        return None
+    return ingester
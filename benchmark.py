@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import glob
+import tempfile
+import threading
+import time
+import logging
+import psutil
+import config
+import database
+from corpus import generateBenchmarkCorpus
+from extraction import hashFile
+from metrics import getStageTimings, resetStageTimings
+
+## end to end benchmark of processPdf, processPdfsConcurrently and processJson on a synthetic corpus
+## usage: python benchmark.py --per-category 3 --output bench.json [--mongo-uri mongodb://localhost:27017/]
+## without --mongo-uri the benchmark runs against mongomock, so no database server is needed.
+## engine stages run on other workers, so their timings are latencies (queue wait included).
+
+
+## class sampling peak rss of this process and its children (pool workers)
+class PeakRssSampler:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peakRss = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        process = psutil.Process()
+        while not self.stopped.is_set():
+            try:
+                rss = process.memory_info().rss + sum(child.memory_info().rss for child in process.children(recursive=True))
+                self.peakRss = max(self.peakRss, rss)
+            except psutil.Error:
+                pass ## a worker exited while sampling
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+
+## function to summarise the stage histograms of one run
+def stageReport(wallSeconds):
+    report = {}
+    for stage, histogram in getStageTimings().items():
+        report[stage] = {
+            "count": histogram["count"],
+            "totalSeconds": round(histogram["sumSeconds"], 3),
+            "throughputPerSecond": round(histogram["count"]/wallSeconds, 3),
+            "p50Seconds": round(histogram["p50Seconds"], 4), ## estimated from the histogram buckets
+            "p95Seconds": round(histogram["p95Seconds"], 4),
+        }
+    return report
+
+
+## function to point the pipeline at a clean mongodb stand-in
+def connectDatabase(mongoUri):
+    if mongoUri:
+        from pymongo import MongoClient
+        database.useClient(MongoClient(mongoUri))
+    else:
+        import mongomock ## pip install mongomock
+        database.useClient(mongomock.MongoClient())
+
+
+## function to clear state that would turn later runs into cache hits
+def resetState(documents):
+    database.getCollection().drop()
+    database.getLshCollection().drop() ## otherwise documents match the previous run's near duplicates
+    import nearDuplicates
+    nearDuplicates.lshIndexesEnsured = False
+    from cache import resultCache
+    if resultCache and resultCache.connection is not None:
+        with resultCache.lock:
+            resultCache.connection.execute("DELETE FROM results")
+            resultCache.connection.commit()
+    if config.ocrCacheDir:
+        for document in documents:
+            for cachePath in glob.glob(os.path.join(config.ocrCacheDir, f"{hashFile(document['path'])}-*")):
+                os.remove(cachePath)
+    resetStageTimings()
+
+
+## function to run one entry point over the corpus
+def runMode(mode, documents, folderPath):
+    import parsing ## imported here so connectDatabase runs first
+
+    if mode == "processPdf":
+        run = lambda: [parsing.processPdf(document["path"]) for document in documents]
+    elif mode == "processPdfsConcurrently":
+        run = lambda: parsing.processPdfsConcurrently(folderPath)
+    else:
+        manifestPath = os.path.join(tempfile.mkdtemp(prefix="pdf_manifest_"), "manifest.json")
+        with open(manifestPath, 'w') as f:
+            json.dump({f"document{i}": document["path"] for i, document in enumerate(documents)}, f)
+        run = lambda: parsing.processJson(manifestPath)
+
+    resetState(documents)
+    with PeakRssSampler() as sampler:
+        startTime = time.perf_counter()
+        run()
+        wallSeconds = time.perf_counter()-startTime
+
+    processed = database.getCollection().count_documents({"summary": {"$exists": True}})
+    return {
+        "wallSeconds": round(wallSeconds, 3),
+        "documents": len(documents),
+        "processed": processed,
+        "docsPerSecond": round(len(documents)/wallSeconds, 3),
+        "peakRssMb": round(sampler.peakRss/1024/1024, 1),
+        "stages": stageReport(wallSeconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End to end pipeline benchmark on a synthetic pdf corpus.")
+    parser.add_argument("--folder", default=None, help="corpus folder, a temporary folder by default")
+    parser.add_argument("--per-category", type=int, default=3, help="pdfs per length category")
+    parser.add_argument("--scanned", type=float, default=0.25, help="fraction of image only pdfs")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="fraction of pdfs copied under another name")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", default=None, help="local mongod to use instead of mongomock")
+    parser.add_argument("--modes", nargs="+", default=["processPdf", "processPdfsConcurrently", "processJson"])
+    parser.add_argument("--output", default=None, help="write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    connectDatabase(args.mongo_uri)
+
+    folderPath = args.folder or tempfile.mkdtemp(prefix="pdf_benchmark_")
+    documents = generateBenchmarkCorpus(folderPath, args.per_category, args.scanned, args.duplicates, args.seed)
+
+    report = {
+        "corpus": {
+            "folder": folderPath,
+            "documents": len(documents),
+            "scanned": sum(document["scanned"] for document in documents),
+            "duplicates": sum(document["duplicateOf"] is not None for document in documents),
+            "seed": args.seed,
+        },
+        "runs": {mode: runMode(mode, documents, folderPath) for mode in args.modes},
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
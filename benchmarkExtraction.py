@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import logging
+import psutil
+from corpus import generateCorpus
+from extraction import extractionBackends, iterPageTexts
+
+## benchmark of the text extraction backends on a generated pdf corpus
+## usage: python benchmarkExtraction.py --documents 20 --pages 1 5 20 100
+
+
+## function to run one backend over the corpus
+def runBackend(backend, filePaths):
+    process = psutil.Process()
+    peakRss = process.memory_info().rss
+    pageCount = 0
+    characters = 0
+
+    startTime = time.perf_counter()
+    for filePath in filePaths:
+        for pageText in iterPageTexts(filePath, backend): ## streamed, so only one page is held at a time
+            pageCount += 1
+            characters += len(pageText)
+            if pageCount % 50 == 0:
+                peakRss = max(peakRss, process.memory_info().rss)
+    elapsed = time.perf_counter()-startTime
+    peakRss = max(peakRss, process.memory_info().rss)
+
+    return {
+        "seconds": round(elapsed, 3),
+        "docsPerSecond": round(len(filePaths)/elapsed, 2),
+        "pagesPerSecond": round(pageCount/elapsed, 2),
+        "pages": pageCount,
+        "characters": characters,
+        "peakRssMb": round(peakRss/1024/1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare extraction backends on a generated pdf corpus.")
+    parser.add_argument("--documents", type=int, default=20, help="number of generated pdfs")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20, 100], help="page counts to cycle through")
+    parser.add_argument("--folder", default=None, help="corpus folder, a temporary folder by default")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    folderPath = args.folder or tempfile.mkdtemp(prefix="pdf_corpus_")
+    filePaths = generateCorpus(folderPath, args.documents, tuple(args.pages), args.seed)
+
+    results = {"corpus": folderPath, "documents": len(filePaths), "corpusMb": round(sum(os.path.getsize(p) for p in filePaths)/1024/1024, 2)}
+    for backend in extractionBackends:
+        results[backend] = runBackend(backend, filePaths)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
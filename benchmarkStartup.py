@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+## benchmark of startup cost: module import time and first document latency, each in a fresh interpreter
+## usage: python benchmarkStartup.py --repeat 3
+
+## script timing the import of one module
+importScript = """
+import time
+startTime = time.perf_counter()
+import {module}
+print(time.perf_counter()-startTime)
+"""
+
+## script timing the first document, with or without warm up first
+firstDocumentScript = """
+import time, json
+startTime = time.perf_counter()
+import parsing
+importTime = time.perf_counter()-startTime
+from summarisation import summariseText ## already imported by parsing
+
+warmUpTime = 0
+if {warm}:
+    warmStart = time.perf_counter()
+    from summarisation import warmUp
+    warmUp()
+    warmUpTime = time.perf_counter()-warmStart
+
+documentStart = time.perf_counter()
+text = parsing.extractTextFromPdf({filePath!r})
+summariseText(text)
+parsing.extractKeywords(text)
+documentTime = time.perf_counter()-documentStart
+print(json.dumps({{"import": importTime, "warmUp": warmUpTime, "firstDocument": documentTime}}))
+"""
+
+
+## function to run a script in a fresh interpreter and return its last output line
+def runFresh(script):
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return output.stdout.strip().splitlines()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and first document latency.")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement, the best run is kept")
+    parser.add_argument("--modules", nargs="+", default=["extraction", "summarisation", "parsing", "engine", "main"])
+    args = parser.parse_args()
+
+    results = {"importSeconds": {}}
+    for module in args.modules:
+        results["importSeconds"][module] = round(min(float(runFresh(importScript.format(module=module))) for _ in range(args.repeat)), 3)
+
+    ## one page document from the synthetic corpus generator
+    from corpus import generateCorpus
+    filePath = generateCorpus(tempfile.mkdtemp(prefix="pdf_startup_"), 1, (1,))[0]
+
+    for warm in (False, True):
+        runs = [json.loads(runFresh(firstDocumentScript.format(warm=warm, filePath=filePath))) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["import"]+run["warmUp"]+run["firstDocument"])
+        results["warm" if warm else "cold"] = {key: round(value, 3) for key, value in best.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import json
+import random
+import time
+import logging
+import bson
+import database
+import textStore
+from benchmark import connectDatabase
+from corpus import generatePageText
+
+## benchmark of collection size and read latency with plain text against compressed text storage (textStore.py)
+## usage: python benchmarkStorage.py --documents 200 [--mongo-uri mongodb://localhost:27017/]
+## with a real mongod sizes come from collStats, with mongomock they are the summed BSON sizes of the documents.
+
+
+## function to build documents shaped like processUrl's, with texts of mixed page counts
+def generateDocuments(count, pageCounts, seed):
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        pages = pageCounts[i % len(pageCounts)]
+        documents.append({
+            "url": f"http://example.com/document{i}.pdf",
+            "lengthCategory": "short",
+            "summary": generatePageText(rng, 60),
+            "keywords": ["revenue", "growth", "budget"],
+            "text": "\f".join(generatePageText(rng) for _ in range(pages)),
+        })
+    return documents
+
+
+## function to get the stored size (bytes) of a collection
+def collectionSize(collection):
+    try:
+        return collection.database.command("collstats", collection.name)["size"]
+    except Exception:
+        return sum(len(bson.encode(document)) for document in collection.find()) ## mongomock has no collStats
+
+
+## function to time a read pass over a collection, average seconds over repeats
+def timeReads(read, repeats):
+    startTime = time.perf_counter()
+    for _ in range(repeats):
+        read()
+    return round((time.perf_counter()-startTime)/repeats, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare collection size and read latency of plain and compressed text.")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20, 100], help="page counts of the texts, cycled")
+    parser.add_argument("--repeats", type=int, default=5, help="read passes per measurement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", default=None, help="local mongod to use instead of mongomock")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    connectDatabase(args.mongo_uri)
+    if not args.mongo_uri:
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration() ## GridFS on mongomock for texts above gridfsThreshold
+    textStore.gridfsBucket = None
+
+    db = database.getDatabase()
+    plain = db["storage_plain"]
+    compressed = db["storage_compressed"]
+    for name in ("storage_plain", "storage_compressed", "texts.files", "texts.chunks"):
+        db.drop_collection(name)
+
+    documents = generateDocuments(args.documents, args.pages, args.seed)
+    plain.insert_many([dict(document) for document in documents])
+    startTime = time.perf_counter()
+    compressed.insert_many([dict(document, text=textStore.encodeText(document["text"], document["url"])) for document in documents])
+    encodeSeconds = time.perf_counter()-startTime
+
+    gridfsSize = collectionSize(db["texts.chunks"]) if "texts.chunks" in db.list_collection_names() else 0
+    report = {
+        "documents": len(documents),
+        "textBytes": sum(len(document["text"].encode("utf-8")) for document in documents),
+        "codec": textStore.textCompression,
+        "plain": {
+            "collectionBytes": collectionSize(plain),
+            "readAllSeconds": timeReads(lambda: list(plain.find()), args.repeats),
+            "readWithoutTextSeconds": timeReads(lambda: list(plain.find({}, textStore.defaultProjection)), args.repeats),
+        },
+        "compressed": {
+            "collectionBytes": collectionSize(compressed),
+            "gridfsBytes": gridfsSize,
+            "encodeSeconds": round(encodeSeconds, 4),
+            "readAllDecodedSeconds": timeReads(lambda: [str(document["text"]) for document in
+                                                        textStore.findDocuments(collection=compressed, withText=True)], args.repeats),
+            "readWithoutTextSeconds": timeReads(lambda: list(textStore.findDocuments(collection=compressed)), args.repeats),
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import random
+import time
+import logging
+from summarisation import summariseText, summariseTexts, loadSummariser, useSummariser
+
+## benchmark comparing summariser backends, one at a time summariseText calls against batched summariseTexts
+## usage: python benchmarkSummarisation.py --documents 32 --batch-size 8 --backends pytorch quantized onnx
+## ROUGE of every backend is measured against the summaries of the first backend (fp32 pytorch by default).
+
+## small vocabulary used to build reproducible synthetic documents
+vocabulary = ("the report shows revenue growth in the third quarter while costs remained stable across "
+              "all regions and the board approved a new budget for research and development of products "
+              "customers reported higher satisfaction after the service update and support teams resolved "
+              "most issues within one day of the request being logged in the system").split()
+
+
+## function to generate documents with a mix of lengths (in words)
+def generateDocuments(count, seed=42):
+    rng = random.Random(seed)
+    lengths = [60, 300, 700, 1200] ## roughly one document per summary length bucket
+    documents = []
+    for i in range(count):
+        words = [rng.choice(vocabulary) for _ in range(lengths[i % len(lengths)])]
+        ## split into sentences so the model sees normal punctuation
+        sentences = [" ".join(words[j:j+15]).capitalize() + "." for j in range(0, len(words), 15)]
+        documents.append(" ".join(sentences))
+    return documents
+
+
+## function to read a fixed local text set, one document per .txt file
+def readDocuments(folderPath):
+    documents = []
+    for fileName in sorted(os.listdir(folderPath)):
+        if fileName.lower().endswith(".txt"):
+            with open(os.path.join(folderPath, fileName), 'r', encoding="utf-8") as f:
+                documents.append(f.read())
+    return documents
+
+
+## function to time a callable and return docs per second
+def docsPerSecond(run, count):
+    startTime = time.perf_counter()
+    run()
+    elapsed = time.perf_counter()-startTime
+    return count/elapsed, elapsed
+
+
+## function to get the length of the longest common subsequence of two token lists
+def lcsLength(a, b):
+    previous = [0]*(len(b)+1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j]+1 if x == y else max(previous[j+1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+## function to get ROUGE-1 and ROUGE-L f1 of a summary against a reference summary
+def rouge(summary, reference):
+    summaryTokens = summary.lower().split()
+    referenceTokens = reference.lower().split()
+    if not summaryTokens or not referenceTokens:
+        return 0.0, 0.0
+
+    def f1(overlap):
+        if overlap == 0:
+            return 0.0
+        precision = overlap/len(summaryTokens)
+        recall = overlap/len(referenceTokens)
+        return 2*precision*recall/(precision+recall)
+
+    referenceCounts = {}
+    for token in referenceTokens:
+        referenceCounts[token] = referenceCounts.get(token, 0)+1
+    unigramOverlap = 0
+    for token in summaryTokens:
+        if referenceCounts.get(token, 0) > 0:
+            referenceCounts[token] -= 1
+            unigramOverlap += 1
+    return f1(unigramOverlap), f1(lcsLength(summaryTokens, referenceTokens))
+
+
+## function to benchmark one backend, returns its results and single document summaries
+def benchmarkBackend(backend, documents, batchSize):
+    startTime = time.perf_counter()
+    useSummariser(loadSummariser(backend))
+    loadSeconds = time.perf_counter()-startTime
+
+    ## warm up so first call overhead is not counted
+    summariseTexts(documents[:2], batchSize=2)
+
+    latencies = []
+    summaries = []
+    for text in documents:
+        startTime = time.perf_counter()
+        summaries.append(summariseText(text))
+        latencies.append(time.perf_counter()-startTime)
+    singleTime = sum(latencies)
+    batchRate, batchTime = docsPerSecond(lambda: summariseTexts(documents, batchSize=batchSize), len(documents))
+
+    latencies.sort()
+    results = {
+        "loadSeconds": round(loadSeconds, 3),
+        "p50LatencySeconds": round(latencies[len(latencies)//2], 3),
+        "p95LatencySeconds": round(latencies[min(len(latencies)-1, int(len(latencies)*0.95))], 3),
+        "single": {"seconds": round(singleTime, 3), "docsPerSecond": round(len(documents)/singleTime, 3)},
+        "batched": {"seconds": round(batchTime, 3), "docsPerSecond": round(batchRate, 3)},
+        "speedup": round(batchRate*singleTime/len(documents), 2),
+    }
+    return results, summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare summariser backends and single against batched summarisation.")
+    parser.add_argument("--documents", type=int, default=32, help="number of synthetic documents")
+    parser.add_argument("--text-folder", default=None, help="folder of .txt files to use instead of synthetic documents")
+    parser.add_argument("--batch-size", type=int, default=8, help="batch size for summariseTexts")
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "quantized"], help="pytorch, quantized and/or onnx")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the synthetic documents")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING) ## keep per document logging out of the timings
+    documents = readDocuments(args.text_folder) if args.text_folder else generateDocuments(args.documents, args.seed)
+
+    results = {"documents": len(documents), "batchSize": args.batch_size, "reference": args.backends[0], "backends": {}}
+    referenceSummaries = None
+    for backend in args.backends:
+        backendResults, summaries = benchmarkBackend(backend, documents, args.batch_size)
+        if referenceSummaries is None:
+            referenceSummaries = summaries
+        scores = [rouge(summary, reference) for summary, reference in zip(summaries, referenceSummaries)]
+        backendResults["rouge1"] = round(sum(score[0] for score in scores)/len(scores), 3)
+        backendResults["rougeL"] = round(sum(score[1] for score in scores)/len(scores), 3)
+        results["backends"][backend] = backendResults
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
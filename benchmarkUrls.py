@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import fitz ## PyMuPDF
+import requests
+from corpus import generateCorpus
+from extraction import extractTextFromUrl
+
+## benchmark of url manifest throughput against a local http.server stand-in
+## usage: python benchmarkUrls.py --documents 50 --threads 16
+
+
+## request handler without per request logging
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+## function to serve a folder on a free local port, returns the server and base url
+def startServer(folderPath):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=folderPath))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+## previous implementation, new connection per request and two copies of the body
+def extractTextUnpooled(url):
+    response = requests.get(url)
+    response.raise_for_status()
+    from io import BytesIO
+    pdfDocument = fitz.open(stream=BytesIO(response.content), filetype="pdf")
+    text = ""
+    for page in pdfDocument:
+        text += page.get_text()
+    return text
+
+
+## function to run a manifest of urls through extract on a thread pool
+def runManifest(extract, urls, threads):
+    startTime = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        characters = sum(len(text) for text in executor.map(extract, urls))
+    elapsed = time.perf_counter()-startTime
+    return {"seconds": round(elapsed, 3), "urlsPerSecond": round(len(urls)/elapsed, 2), "characters": characters}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure url manifest throughput against a local http server.")
+    parser.add_argument("--documents", type=int, default=50, help="number of generated pdfs served")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--threads", type=int, default=16, help="concurrent downloads")
+    parser.add_argument("--repeat", type=int, default=2, help="times every url appears in the manifest")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    folderPath = tempfile.mkdtemp(prefix="pdf_url_corpus_")
+    filePaths = generateCorpus(folderPath, args.documents, tuple(args.pages))
+    server, baseUrl = startServer(folderPath)
+    urls = [f"{baseUrl}/{os.path.basename(filePath)}" for filePath in filePaths] * args.repeat
+
+    try:
+        results = {
+            "urls": len(urls),
+            "threads": args.threads,
+            "unpooled": runManifest(extractTextUnpooled, urls, args.threads),
+            "pooled": runManifest(extractTextFromUrl, urls, args.threads),
+        }
+    finally:
+        server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
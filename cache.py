@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from config import resultCacheEnabled, resultCacheDir, resultCacheSize ## importing from config.py
+from database import getCollection
+
+
+## class caching processed results by content hash
+class ResultCache:
+    """
+    two tier cache of {summary, keywords, keywordScores, lengthCategory, summaryRoute} keyed by the sha256 of the file content.
+    the optional on-disk tier is a small sqlite LRU in cacheDir, the mongodb collection is the backing store.
+    example(how to use):
+    cache = ResultCache(cacheDir="cache")
+    result = cache.get(hashFile(filePath)) ## None on a miss
+    """
+    def __init__(self, cacheDir=resultCacheDir, maxEntries=resultCacheSize, collection=None):
+        self.collection = collection ## None uses the shared collection, resolved on first lookup
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.connection = None
+
+        if cacheDir:
+            os.makedirs(cacheDir, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(cacheDir, "results.sqlite"), check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS results (contentHash TEXT PRIMARY KEY, result TEXT, lastUsed REAL)")
+            self.connection.commit()
+            logging.info(f"Result cache using on-disk tier in {cacheDir} with {maxEntries} entries.")
+
+    ## look up a result, disk tier first then mongodb
+    def get(self, contentHash):
+        if self.connection is not None:
+            with self.lock:
+                row = self.connection.execute("SELECT result FROM results WHERE contentHash = ?", (contentHash,)).fetchone()
+                if row:
+                    self.connection.execute("UPDATE results SET lastUsed = ? WHERE contentHash = ?", (time.time(), contentHash))
+                    self.connection.commit()
+            result = json.loads(row[0]) if row else None
+            if result and result.get("summary"): ## entries with an empty summary written before are skipped
+                logging.info(f"Result cache hit on disk for {contentHash}.")
+                return result
+
+        collection = self.collection if self.collection is not None else getCollection()
+        document = collection.find_one(
+            {"contentHash": contentHash, "summary": {"$nin": [None, ""]}}, ## only documents that finished with a summary
+            {"_id": 0, "summary": 1, "keywords": 1, "keywordScores": 1, "lengthCategory": 1, "summaryRoute": 1}
+        )
+        if document:
+            logging.info(f"Result cache hit in MongoDB for {contentHash}.")
+            self.putOnDisk(contentHash, document)
+            return document
+
+        return None
+
+    ## store a freshly computed result, mongodb already holds it through docUpdation
+    def put(self, contentHash, result):
+        if not result.get("summary"):
+            return ## failed summaries are not reused by copies of the file
+        self.putOnDisk(contentHash, result)
+
+    ## add a result to the disk tier and evict the least recently used entries
+    def putOnDisk(self, contentHash, result):
+        if self.connection is None:
+            return
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (contentHash, json.dumps(result), time.time()))
+            count = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.maxEntries:
+                self.connection.execute(
+                    "DELETE FROM results WHERE contentHash IN (SELECT contentHash FROM results ORDER BY lastUsed LIMIT ?)",
+                    (count-self.maxEntries,)
+                )
+            self.connection.commit()
+
+
+## shared cache used by parsing.py and engine.py
+resultCache = ResultCache() if resultCacheEnabled else None
@@ -1,6 +1,128 @@
+import os
+
 mongoUri = "mongodb://localhost:27017/" ## mongodb URI
 databaseName = "pdf_documents" ## name of database
 collectionName = "processed_docs" ## name of the collection
+queueCollectionName = "work_queue" ## documents waiting for workers in multi-node mode (workQueue.py)
+lshCollectionName = "lsh_index" ## minhash signatures and lsh bands of processed documents (nearDuplicates.py)
 pdfFolderPath = r"C:\Users\Steve\Desktop\Project\pdf_folder" ## local folder
 partitionSizes = {'short': 2, 'medium':10 ,'long': 20} ## pages
 
+## worker counts for each stage of the pipelined engine (engine.py)
+extractionWorkers = os.cpu_count() or 1 ## processes for pdf extraction and ocr
+summariserWorkers = 1 ## threads feeding the summarisation model
+keywordWorkers = 4 ## threads for keyword extraction
+dbWorkers = 2 ## threads for mongodb writes
+
+## batched summarisation (summarisation.py)
+summaryBatchSize = 8 ## documents per model call
+summaryMaxWait = 0.05 ## seconds a document waits for its batch to fill
+
+## summarisation model and backend (summarisation.py)
+summariserModel = "sshleifer/distilbart-cnn-12-6"
+summariserBackend = "pytorch" ## "pytorch" (fp32), "quantized" (dynamic int8) or "onnx" (onnx runtime, needs optimum)
+intraOpThreads = None ## threads inside one model operation, None splits the cores between summariserWorkers
+interOpThreads = 1 ## operations run in parallel
+onnxModelDir = "onnx_model" ## exported onnx model is saved here and reused, None exports on every start
+
+## map reduce summarisation for documents longer than the model input (summarisation.py)
+chunkedSummarisation = True ## False truncates long documents to the first window
+chunkOverlap = 128 ## tokens shared by neighbouring windows
+
+## content hash result cache (cache.py)
+resultCacheEnabled = True ## reuse summary and keywords of files already processed
+resultCacheDir = None ## folder for the on-disk LRU tier, None uses only mongodb
+resultCacheSize = 10000 ## max entries in the on-disk LRU tier
+
+## buffered bulk mongodb writer (docUpdation.py)
+bulkWriteBatchSize = 500 ## operations per bulk_write
+bulkWriteInterval = 1.0 ## seconds between flushes of a partial batch
+bulkWriteMaxQueued = 5000 ## queued operations before writers block (backpressure)
+
+## corpus level keyword model (keywords.py)
+keywordModelPath = "keyword_model.joblib" ## fitted TF-IDF model, built with: python keywords.py <folder>
+keywordBatchSize = 32 ## documents per transform of the fitted keyword model in the engine
+keywordMaxWait = 0.05 ## seconds a document waits for its keyword batch to fill
+
+## page level OCR (extraction.py)
+ocrDpi = 300 ## resolution pages are rendered at for tesseract
+ocrGrayscale = True ## render pages in grayscale, smaller pixmaps and faster OCR
+ocrWorkers = os.cpu_count() or 1 ## processes used to OCR pages of a single document
+ocrCacheDir = "ocr_cache" ## per page OCR results so a retry does not redo finished pages, None disables it
+
+## text extraction backend (extraction.py), "pymupdf" or "pdfminer", pdfminer is always the fallback
+extractionBackend = "pymupdf"
+
+## shared http client for pdf urls (httpClient.py)
+httpPoolSize = 32 ## keep-alive connections per host
+httpConnectTimeout = 5 ## seconds
+httpReadTimeout = 60 ## seconds between received bytes
+httpRetries = 3 ## retries on connection errors and 429/5xx responses
+httpBackoff = 0.5 ## backoff factor between retries (0.5s, 1s, 2s, ...)
+spoolThreshold = 16*1024*1024 ## downloads larger than this (bytes) are spooled to a temporary file
+
+## metrics (metrics.py)
+metricsSampleInterval = 1.0 ## seconds between background cpu/rss/thread samples
+metricsPort = None ## serve /metrics (prometheus) and /metrics.json on this port, None disables it
+metricsOutputPath = None ## write the run's metrics as JSON here at the end of folder and JSON runs
+
+## bounded in-flight scheduling (scheduler.py)
+maxInFlight = 64 ## documents submitted to the engine and not finished yet
+inFlightByteBudget = 2*1024*1024*1024 ## total file size (bytes) of documents in flight
+largeFileBytes = 50*1024*1024 ## files at least this size (bytes) are large
+maxLargeInFlight = 2 ## large files in flight at once
+rssBudget = None ## pause admitting work while rss (bytes) of the pipeline and its workers is above this, None disables it
+
+## job ordering for folder and JSON runs (scheduler.py)
+jobOrder = "fifo" ## "fifo", "longest" (shortest makespan) or "shortest" (fastest first results)
+costWeights = {"textPage": 0.05, "scannedPage": 2.0, "megabyte": 0.1} ## estimated seconds per page / per MB
+costReportPath = None ## write estimated vs actual cost of every document as JSON here, None only logs a summary
+
+## asyncio url front end for JSON manifests (asyncIngestion.py), needs aiohttp
+asyncIngestion = True ## download manifest urls on an event loop, falls back to the engine's workers without aiohttp
+asyncConnections = 256 ## open connections in total
+asyncConnectionsPerHost = 8 ## open connections to a single host
+asyncMaxDownloads = 256 ## urls being downloaded at once
+asyncQueueSize = 32 ## downloaded pdfs waiting for the engine, downloads pause while this is full
+
+## JSON manifests (manifest.py)
+resultLogPath = None ## append one JSON line per processed manifest entry here, None only logs the totals
+
+## tiered summarisation policy (summarisation.py)
+extractiveCategories = ("short",) ## length categories (partitionText) summarised extractively, () sends everything to the model
+extractiveMaxWords = 500 ## documents longer than this always go to the model, whatever their category
+extractiveSentences = 3 ## sentences picked by the extractive summariser
+
+## resumable job journal (journal.py)
+journalEnabled = True ## record finished stages per file so a restarted run skips finished work
+journalKeepText = True ## keep the extracted text on the document so a later failure does not redo extraction and OCR
+
+## multi-node worker mode (workQueue.py)
+leaseSeconds = 300 ## a claimed item goes back to the queue if its worker misses heartbeats for this long
+heartbeatInterval = 30 ## seconds between lease renewals of running items
+maxAttempts = 3 ## claims of an item before it is marked failed
+queuePollInterval = 2 ## seconds an idle worker waits before claiming again
+workerConcurrency = 16 ## items a worker runs at once
+
+## extracted text storage (textStore.py)
+textCompression = "zstd" ## "zstd" (needs zstandard, falls back to zlib), "zlib", or None to store plain text
+textCompressionLevel = 3
+gridfsThreshold = 1024*1024 ## compressed texts larger than this (bytes) go to GridFS instead of the document, None keeps all inline
+
+## watch folder daemon (watchFolder.py)
+watchDebounce = 2.0 ## seconds a file must stop changing before it is processed
+watchPollInterval = 5.0 ## seconds between folder scans when polling
+watchUsePolling = False ## poll instead of watchdog events, e.g. for network shares
+
+## extraction worker recycling and per document caps (workerPool.py)
+workerMaxTasks = 200 ## documents or pages a worker process handles before the pool is recycled, None disables it
+workerRecycleRss = 1024*1024*1024 ## recycle the pool when a worker's uss (bytes, memory not shared with the parent) after a task is above this, None disables it
+documentRssLimit = 4*1024*1024*1024 ## kill a worker whose uss (bytes) goes above this while running a task, None disables it
+documentTimeout = 600 ## kill a worker whose task runs longer than this (seconds), None disables it
+
+## near duplicate detection (nearDuplicates.py)
+nearDuplicateEnabled = True ## reuse the summary and keywords of an already processed document with nearly the same text
+nearDuplicateThreshold = 0.9 ## estimated jaccard similarity of the shingle sets from which a document is a near duplicate
+minhashPermutations = 128 ## length of the minhash signature
+lshBands = 16 ## bands of the lsh index, each of minhashPermutations/lshBands rows; more bands find less similar candidates
+shingleSize = 5 ## words per shingle
@@ -0,0 +1,104 @@
+import os
+import random
+import shutil
+import fitz ## PyMuPDF
+import logging
+from config import partitionSizes ## importing from config.py
+
+## generator of reproducible synthetic pdf corpora for the benchmarks
+## usage: python corpus.py <folder> [count] [pages]
+
+## small vocabulary used to build the page text
+vocabulary = ("the report shows revenue growth in the third quarter while costs remained stable across "
+              "all regions and the board approved a new budget for research and development of products "
+              "customers reported higher satisfaction after the service update and support teams resolved "
+              "most issues within one day of the request being logged in the system").split()
+
+
+## function to generate the text of one page
+def generatePageText(rng, words=350):
+    pageWords = [rng.choice(vocabulary) for _ in range(words)]
+    sentences = [" ".join(pageWords[i:i+15]).capitalize() + "." for i in range(0, len(pageWords), 15)]
+    return " ".join(sentences)
+
+
+## function to write a pdf with a text layer on every page
+def generateTextPdf(filePath, pageCount, rng):
+    pdf = fitz.open()
+    for _ in range(pageCount):
+        page = pdf.new_page() ## default A4 size
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width-50, page.rect.height-50), generatePageText(rng), fontsize=10)
+    pdf.save(filePath)
+    pdf.close()
+
+
+## function to write an image only pdf, like a scanned document without a text layer
+def generateScannedPdf(filePath, pageCount, rng, dpi=100):
+    pdf = fitz.open()
+    for _ in range(pageCount):
+        ## render a text page to an image, then place only the image on the output page
+        source = fitz.open()
+        sourcePage = source.new_page()
+        sourcePage.insert_textbox(fitz.Rect(50, 50, sourcePage.rect.width-50, sourcePage.rect.height-50), generatePageText(rng), fontsize=12)
+        pixmap = sourcePage.get_pixmap(dpi=dpi)
+        page = pdf.new_page(width=sourcePage.rect.width, height=sourcePage.rect.height)
+        page.insert_image(page.rect, pixmap=pixmap)
+        source.close()
+    pdf.save(filePath)
+    pdf.close()
+
+
+## function to generate a folder of text pdfs
+def generateCorpus(folderPath, count=20, pages=(1, 5, 20), seed=42):
+    """
+    writes count pdfs to folderPath, page counts cycle through pages.
+    the same seed always gives the same corpus, returns the list of file paths.
+    """
+    os.makedirs(folderPath, exist_ok=True)
+    rng = random.Random(seed)
+    filePaths = []
+    for i in range(count):
+        filePath = os.path.join(folderPath, f"document_{i:04d}.pdf")
+        generateTextPdf(filePath, pages[i % len(pages)], rng)
+        filePaths.append(filePath)
+    logging.info(f"Generated {count} pdfs in {folderPath}.")
+    return filePaths
+
+
+## function to generate the benchmark corpus with every length category, scanned pdfs and duplicates
+def generateBenchmarkCorpus(folderPath, perCategory=3, scannedFraction=0.25, duplicateFraction=0.2, seed=42):
+    """
+    writes perCategory pdfs for each of short/medium/long (page counts from partitionSizes),
+    about scannedFraction of them image only, and byte identical copies of about duplicateFraction of them.
+    returns a list of {"path", "category", "pages", "scanned", "duplicateOf"}.
+    """
+    os.makedirs(folderPath, exist_ok=True)
+    rng = random.Random(seed)
+    documents = []
+    for category in ("short", "medium", "long"):
+        for i in range(perCategory):
+            scanned = rng.random() < scannedFraction
+            filePath = os.path.join(folderPath, f"{category}_{i:03d}{'_scanned' if scanned else ''}.pdf")
+            pageCount = partitionSizes[category]
+            if scanned:
+                generateScannedPdf(filePath, pageCount, rng)
+            else:
+                generateTextPdf(filePath, pageCount, rng)
+            documents.append({"path": filePath, "category": category, "pages": pageCount, "scanned": scanned, "duplicateOf": None})
+
+    ## copies under another name, so the result cache sees the same content hash
+    for original in rng.sample(documents, int(len(documents)*duplicateFraction)):
+        filePath = original["path"].replace(".pdf", "_copy.pdf")
+        shutil.copyfile(original["path"], filePath)
+        documents.append({**original, "path": filePath, "duplicateOf": original["path"]})
+
+    logging.info(f"Generated benchmark corpus of {len(documents)} pdfs in {folderPath}.")
+    return documents
+
+
+if __name__ == "__main__":
+    import sys
+    folderPath = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    pages = (int(sys.argv[3]),) if len(sys.argv) > 3 else (1, 5, 20)
+    generateCorpus(folderPath, count, pages)
@@ -0,0 +1,92 @@
+import os
+import threading
+import logging
+from config import mongoUri, databaseName, collectionName, queueCollectionName, lshCollectionName ## importing from config.py
+
+## mongoClient of this process, created on first use so imports and pool workers stay fast
+client = None
+clientPid = None ## MongoClient is not fork safe, a forked worker opens its own
+clientLock = threading.Lock()
+indexesEnsured = False
+
+
+## function returning the shared MongoClient of this process
+def getClient():
+    global client, clientPid
+    with clientLock:
+        if client is None or clientPid != os.getpid():
+            from pymongo import MongoClient ## mongoclient
+            client = MongoClient(mongoUri)
+            clientPid = os.getpid()
+            logging.info(f"Connected MongoClient to {mongoUri}.")
+    return client
+
+
+## function to use an already created client, e.g. mongomock.MongoClient() in benchmarks
+def useClient(newClient):
+    global client, clientPid
+    with clientLock:
+        client = newClient
+        clientPid = os.getpid()
+
+
+## function returning the pipeline database
+def getDatabase():
+    return getClient()[databaseName]
+
+
+## function returning the processed documents collection
+def getCollection():
+    return getDatabase()[collectionName]
+
+
+## function returning the work queue collection of multi-node runs (workQueue.py)
+def getQueueCollection():
+    return getDatabase()[queueCollectionName]
+
+
+## function returning the lsh index of near duplicate detection (nearDuplicates.py)
+def getLshCollection():
+    return getDatabase()[lshCollectionName]
+
+
+## keeps "from database import collection" working, the client is created on access
+def __getattr__(name):
+    if name == "collection":
+        return getCollection()
+    if name == "db":
+        return getDatabase()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+## function to create the indexes the pipeline's updates and searches rely on, once per process
+def ensureIndexes():
+    """
+    without them every update by filePath and every cache lookup by contentHash scans the whole collection.
+    filePath is unique for documents that have one (url documents do not), contentHash is not,
+    copies of a file share it. keywords is a multikey index used by search.py.
+    create_index is a no-op for indexes that already exist.
+    """
+    global indexesEnsured
+    if indexesEnsured:
+        return
+    from pymongo import ASCENDING, DESCENDING, errors
+    collection = getCollection()
+    try:
+        collection.create_index([("filePath", ASCENDING)], unique=True, partialFilterExpression={"filePath": {"$exists": True}})
+    except errors.OperationFailure as e:
+        ## older runs inserted the same path more than once, index it without the unique constraint
+        logging.warning(f"Duplicate file paths in {collection.name}, creating a non unique filePath index: {e}")
+        collection.create_index([("filePath", ASCENDING)])
+    collection.create_index([("contentHash", ASCENDING)])
+    collection.create_index([("url", ASCENDING)])
+    collection.create_index([("processedAt", DESCENDING)])
+    collection.create_index([("keywords", ASCENDING)])
+    indexesEnsured = True
+    logging.info("MongoDB indexes ensured.")
+
+
+## function to open the connection before the first document, for long running workers
+def warmUp():
+    getClient().admin.command("ping")
+    ensureIndexes()
@@ -1,17 +1,23 @@
-from pymongo import collection
+from database import getCollection
+from config import bulkWriteBatchSize, bulkWriteInterval, bulkWriteMaxQueued ## importing from config.py
 import datetime
-from pymongo import errors
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from pymongo import errors, UpdateOne, InsertOne
 
 ## update document
 def update_document(filePath, summary, keywords):
-    collection.update_one(
-     {"file_path": filePath}, ## filter to find document
+    getCollection().update_one(
+     {"filePath": filePath}, ## filter to find document, the indexed field (database.ensureIndexes)
       {"$set": {"summary": summary, "keywords": keywords}}  ## update document
     )
 
 
 ## function to store initial metadata in mongodb
-def storeInitialMetadata(filePath, size):
+def storeInitialMetadata(filePath, size, contentHash=None, writer=None):
     ## creating a metadata dictionary 
     try:
         metadata = {
@@ -19,12 +25,20 @@ def storeInitialMetadata(filePath, size):
             "size" : size,
             "ingestedAt" : datetime.datetime.now() ## store as datetime object
         }
+        if contentHash:
+            metadata["contentHash"] = contentHash ## used by the result cache (cache.py)
+
+        ingestedAt = metadata.pop("ingestedAt") ## only set when the document is created
+
+        ## queue as an upsert so the writer can merge it with the later update
+        if writer is not None:
+            return writer.upsert({"filePath" : filePath}, metadata, {"ingestedAt" : ingestedAt})
         
-        ## insert data into mongodb
-        result = collection.InsertOne(metadata)
+        ## upsert into mongodb, filePath is unique (database.ensureIndexes) so a re-run updates the same document
+        result = getCollection().update_one({"filePath" : filePath}, {"$set" : metadata, "$setOnInsert" : {"ingestedAt" : ingestedAt}}, upsert=True)
 
         ## print confirmation message
-        print(f"Initial metadata dtored for {filePath}. Document ID: {result.inserted_id}")
+        print(f"Initial metadata dtored for {filePath}. Document ID: {result.upserted_id}")
     
     except errors.PyMongoError as e:
         print(f"Failed to store metadata for {filePath} due to error {e}")
@@ -32,7 +46,8 @@ def storeInitialMetadata(filePath, size):
 
 
 ## function to update mongodb entry with summary and keywords after processing
-def updateProcessedDocument(filePath,summary, keywords,processingTime):
+def updateProcessedDocument(filePath,summary, keywords,processingTime, contentHash=None, lengthCategory=None, writer=None, summaryRoute=None, keywordScores=None,
+                            nearDuplicate=None):
     ## converting time to seconds
     try:
         processingTimeInSeconds = processingTime.total_seconds()
@@ -44,9 +59,23 @@ def updateProcessedDocument(filePath,summary, keywords,processingTime):
             "processingTime" : processingTimeInSeconds, ## storing as seconds
             "processedAt" : datetime.datetime.now() ## datetime object 
         }
+        if contentHash:
+            updateData["contentHash"] = contentHash
+        if lengthCategory:
+            updateData["lengthCategory"] = lengthCategory
+        if keywordScores is not None:
+            updateData["keywordScores"] = keywordScores ## [{"keyword", "score"}] for search ranking
+        if summaryRoute:
+            updateData["summaryRoute"] = summaryRoute ## extractive or abstractive (summarisation.chooseSummaryRoute)
+        if nearDuplicate:
+            updateData.update(nearDuplicateFields(nearDuplicate)) ## results reused from a near duplicate
+
+        ## queue the update, returns a future resolved when the batch is written
+        if writer is not None:
+            return writer.upsert({"filePath" : filePath}, updateData)
 
         ## ingesting data into mongodb
-        result = collection.UpdateOne(
+        result = getCollection().update_one(
             {"filePath" : filePath}, ## matching file path
             {"$set" : updateData} ## updating the summary keywords and processing time
         )
@@ -63,4 +92,186 @@ def updateProcessedDocument(filePath,summary, keywords,processingTime):
     
     ## checking any other error
     except Exception as e:
-        print(f"An unexpected error has occured: {e}.")
\ No newline at end of file
+        print(f"An unexpected error has occured: {e}.")
+
+
+## function returning the fields linking a document to the near duplicate it reused results from (nearDuplicates.py)
+def nearDuplicateFields(match):
+    return {"nearDuplicateOf" : match["nearDuplicateOf"], "nearDuplicateSimilarity" : match["similarity"]}
+
+
+## function to record a file whose content was already processed (result cache hit)
+def storeCachedResult(filePath, size, contentHash, result, writer=None):
+    try:
+        cachedData = {
+            "filePath" : filePath,
+            "size" : size,
+            "contentHash" : contentHash,
+            "summary" : result.get("summary"), ## reused summary
+            "keywords" : result.get("keywords"), ## reused keywords
+            "keywordScores" : result.get("keywordScores"),
+            "lengthCategory" : result.get("lengthCategory"),
+            "summaryRoute" : result.get("summaryRoute"),
+            "processingTime" : 0,
+            "processedAt" : datetime.datetime.now(),
+            "fromCache" : True
+        }
+
+        ## only the path mapping is new, upsert so re-runs over the same path do not duplicate it
+        if writer is not None:
+            return writer.upsert({"filePath" : filePath}, cachedData, {"ingestedAt" : datetime.datetime.now()})
+
+        getCollection().update_one(
+            {"filePath" : filePath},
+            {"$set" : cachedData, "$setOnInsert" : {"ingestedAt" : datetime.datetime.now()}},
+            upsert=True
+        )
+        print(f"Cached result stored for {filePath}")
+
+    except errors.PyMongoError as e:
+        print(f"Failed to store cached result for {filePath} due to error {e}")
+
+
+## class queueing mongodb writes and flushing them as unordered bulk_write batches
+class BulkWriter:
+    """
+    buffered writer used by the pipeline engine instead of one insert and one update per document.
+    operations are queued (the queue is bounded, so callers block when mongodb falls behind) and
+    flushed by a background thread when batchSize operations are pending or every flushInterval seconds.
+    upserts on the same filter that are still pending are collapsed into one upsert, so the initial
+    metadata and the processed update of a document usually cost a single operation.
+    every call returns a future resolved once its batch has been written.
+    example(how to use):
+    writer = BulkWriter() ## or BulkWriter(collection=mongomock.MongoClient().db.docs) in tests
+    future = writer.upsert({"filePath": filePath}, {"summary": summary})
+    writer.close() ## flushes everything still pending
+    """
+    def __init__(self, collection=None, batchSize=bulkWriteBatchSize, flushInterval=bulkWriteInterval, maxQueued=bulkWriteMaxQueued):
+        self.collection = collection if collection is not None else getCollection()
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.queue = queue.Queue(maxsize=maxQueued)
+        self.pending = {} ## key -> operation, dicts keep insertion order
+        self.batchLatencies = [] ## seconds per bulk_write
+        self.operationCount = 0 ## operations queued
+        self.collapsedCount = 0 ## operations merged into an already pending upsert
+        self.thread = threading.Thread(target=self.run, name="bulk-writer", daemon=True)
+        self.thread.start()
+
+    ## queue an upsert, setOnInsert fields are only written when the document is created
+    def upsert(self, filterDoc, setFields, setOnInsert=None):
+        future = Future()
+        self.enqueue(("upsert", filterDoc, dict(setFields), dict(setOnInsert or {}), future)) ## blocks when full
+        return future
+
+    ## queue an insert of a new document
+    def insert(self, document):
+        future = Future()
+        self.enqueue(("insert", None, document, None, future))
+        return future
+
+    ## put an operation on the queue, or straight into the pending batch on the writer thread
+    def enqueue(self, item):
+        if threading.current_thread() is self.thread:
+            ## done callbacks of batch futures run here, waiting on the full queue would block the only thread draining it
+            self.add(*item)
+            return
+        self.queue.put(item)
+
+    ## write everything queued so far and wait for it
+    def flush(self):
+        done = threading.Event()
+        self.queue.put(("flush", None, None, None, done))
+        done.wait()
+
+    ## flush and stop the background thread
+    def close(self):
+        self.queue.put(("close", None, None, None, None))
+        self.thread.join()
+        if self.batchLatencies:
+            logging.info(f"Bulk writer wrote {self.operationCount} operations in {len(self.batchLatencies)} batches, "
+                         f"{self.collapsedCount} collapsed, average batch latency {sum(self.batchLatencies)/len(self.batchLatencies):.3f} seconds.")
+
+    ## add an operation to the pending batch, collapsing upserts on the same filter
+    def add(self, kind, filterDoc, fields, setOnInsert, future):
+        self.operationCount += 1
+        if kind == "insert":
+            self.pending[("insert", id(future))] = {"kind": kind, "document": fields, "futures": [future]}
+            return
+
+        key = ("upsert", tuple(sorted(filterDoc.items())))
+        operation = self.pending.get(key)
+        if operation is None:
+            self.pending[key] = {"kind": kind, "filter": filterDoc, "set": fields, "setOnInsert": setOnInsert, "futures": [future]}
+            return
+
+        operation["set"].update(fields)
+        operation["setOnInsert"].update(setOnInsert)
+        operation["futures"].append(future)
+        self.collapsedCount += 1
+
+    ## write the pending batch with one unordered bulk_write
+    def write(self):
+        if not self.pending:
+            return
+        operations = list(self.pending.values())
+        self.pending = {}
+
+        requests = []
+        for operation in operations:
+            if operation["kind"] == "insert":
+                requests.append(InsertOne(operation["document"]))
+            else:
+                update = {"$set": operation["set"]}
+                ## a field can not be in $set and $setOnInsert at the same time
+                setOnInsert = {key: value for key, value in operation["setOnInsert"].items() if key not in operation["set"]}
+                if setOnInsert:
+                    update["$setOnInsert"] = setOnInsert
+                requests.append(UpdateOne(operation["filter"], update, upsert=True))
+
+        startTime = time.perf_counter()
+        failed = {}
+        try:
+            self.collection.bulk_write(requests, ordered=False)
+        except errors.BulkWriteError as bwe:
+            ## unordered batches keep going, only fail the operations that errored
+            for writeError in bwe.details.get("writeErrors", []):
+                failed[writeError["index"]] = errors.PyMongoError(writeError.get("errmsg"))
+        except Exception as e:
+            failed = {index: e for index in range(len(operations))}
+
+        latency = time.perf_counter()-startTime
+        self.batchLatencies.append(latency)
+        logging.info(f"Bulk write of {len(requests)} operations in {latency:.3f} seconds, {len(failed)} failed.")
+
+        for index, operation in enumerate(operations):
+            for future in operation["futures"]:
+                if index in failed:
+                    future.set_exception(failed[index])
+                else:
+                    future.set_result(None)
+
+    ## background thread, flushes on batch size or interval
+    def run(self):
+        lastFlush = time.monotonic()
+        while True:
+            timeout = max(0, lastFlush+self.flushInterval-time.monotonic())
+            try:
+                kind, filterDoc, fields, setOnInsert, future = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind = None
+
+            if kind in ("upsert", "insert"):
+                self.add(kind, filterDoc, fields, setOnInsert, future)
+                if len(self.pending) < self.batchSize and time.monotonic()-lastFlush < self.flushInterval:
+                    continue
+
+            self.write()
+            lastFlush = time.monotonic()
+
+            if kind == "flush":
+                future.set() ## future is an Event for flush requests
+            elif kind == "close":
+                while self.pending: ## queued by done callbacks of the last batch
+                    self.write()
+                return
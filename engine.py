@@ -0,0 +1,381 @@
+import os
+import datetime
+import threading
+import logging
+from metrics import trackFuture, incrementCounter
+from concurrent.futures import ThreadPoolExecutor, Future
+from workerPool import RecyclingPool
+from config import extractionWorkers, summariserWorkers, keywordWorkers, dbWorkers, nearDuplicateEnabled ## importing from config.py
+from extraction import hashFile, extractPdf, extractUrl, extractDownload, ocrPage, partitionText
+from summarisation import MicroBatcher, chooseSummaryRoute
+from keywords import extractKeywords, extractiveSummary, getKeywordModel, keywordScoreDocs, KeywordBatcher
+from docUpdation import storeInitialMetadata, updateProcessedDocument, storeCachedResult, nearDuplicateFields, BulkWriter
+from cache import resultCache
+from journal import loadJournal, lastStage, markStage
+from textStore import encodeText
+from nearDuplicates import findNearDuplicate, indexDocument, matchScores
+
+
+## helper to run a callback once every future in a list has finished
+def whenAll(futures, callback):
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def onDone(future):
+        with lock:
+            remaining[0] -= 1
+            finished = remaining[0] == 0
+        if finished:
+            callback(futures)
+
+    for future in futures:
+        future.add_done_callback(onDone)
+
+
+## helper returning a future that already holds value
+def completedFuture(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+## class holding the state of a single document moving through the engine
+class PipelineJob:
+    def __init__(self, source, isUrl=False):
+        self.source = source ## file path or url
+        self.isUrl = isUrl
+        self.startTime = datetime.datetime.now()
+        self.size = None
+        self.contentHash = None
+        self.lengthCategory = None
+        self.summaryRoute = None ## "extractive" or "abstractive" (chooseSummaryRoute)
+        self.journal = None ## finished stages of an earlier run (journal.py)
+        self.signature = None ## minhash signature, indexed once the document is persisted (nearDuplicates.py)
+        self.nearDuplicate = None ## processed document whose results were reused
+        self.result = Future() ## resolved once the document is persisted
+
+
+## pipelined engine with a separate pool for every stage
+class PipelineEngine:
+    """
+    runs document processing as a pipeline of stages instead of one function per thread.
+    extraction and page level OCR run in a process pool so they are not limited by the GIL,
+    summarisation runs on a dedicated model worker fed by a micro batcher,
+    keywords run in light threads and mongodb writes go through a buffered bulk writer.
+    example(how to use):
+    with PipelineEngine() as engine:
+        futures = [engine.submitPdf(filePath) for filePath in pdfFiles]
+    """
+    def __init__(self, extractionWorkers=extractionWorkers, summariserWorkers=summariserWorkers,
+                 keywordWorkers=keywordWorkers, dbWorkers=dbWorkers, cache=resultCache):
+        logging.info(f"Starting pipeline engine with {extractionWorkers} extraction, {summariserWorkers} summariser, "
+                     f"{keywordWorkers} keyword and {dbWorkers} db workers.")
+        self.extractionPool = RecyclingPool(maxWorkers=extractionWorkers) ## recycles workers, isolates documents over the caps
+        self.batcher = MicroBatcher(workers=summariserWorkers) ## batches documents for the model worker
+        self.keywordPool = ThreadPoolExecutor(max_workers=keywordWorkers, thread_name_prefix="keywords")
+        self.dbPool = ThreadPoolExecutor(max_workers=dbWorkers, thread_name_prefix="db") ## hashing and cache lookups
+        self.writer = BulkWriter() ## buffered mongodb writes
+        self.cache = cache ## content hash result cache, None disables it
+        self.keywordModel = getKeywordModel() ## saved corpus idf model, None fits per document
+        ## with a corpus model documents are transformed in batches, without one every document fits its own idf
+        self.keywordBatcher = KeywordBatcher(self.keywordModel) if self.keywordModel is not None else None
+
+        ## futures of documents still moving through the pipeline
+        self.pending = set()
+        self.pendingLock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    ## submit a local pdf to the pipeline
+    def submitPdf(self, filePath):
+        job = PipelineJob(filePath)
+        self.track(job)
+
+        ## hash and cache lookup are io bound so they run on the db threads
+        lookupFuture = trackFuture("hash", self.dbPool.submit(self.lookup, job))
+        lookupFuture.add_done_callback(lambda future: self.onLookedUp(job, future))
+        return job.result
+
+    ## hash the file, load its journal and look it up in the result cache
+    def lookup(self, job):
+        job.size = os.path.getsize(job.source)
+        job.contentHash = hashFile(job.source)
+        job.journal = loadJournal(job.source, job.contentHash)
+        if lastStage(job.journal) == "persisted":
+            return None ## finished by an earlier run
+        return self.cache.get(job.contentHash) if self.cache else None
+
+    ## finished files are skipped, a cache hit records the path mapping,
+    ## a file with extracted text resumes after its last stage and anything else goes to extraction
+    def onLookedUp(self, job, future):
+        try:
+            cached = future.result()
+        except Exception as e:
+            logging.error(f"Error reading {job.source}: {e}")
+            job.result.set_exception(e)
+            return
+
+        if lastStage(job.journal) == "persisted":
+            logging.info(f"Skipping {job.source}, already processed.")
+            job.result.set_result(job.source)
+            return
+
+        if cached:
+            job.lengthCategory = cached.get("lengthCategory")
+            writeFuture = trackFuture("db", storeCachedResult(job.source, job.size, job.contentHash, cached, writer=self.writer))
+            writeFuture.add_done_callback(lambda future: self.onPersisted(job, future))
+            return
+
+        if job.journal and job.journal.get("text"):
+            logging.info(f"Resuming {job.source} after stage {lastStage(job.journal)}.")
+            self.deduplicate(job, job.journal["text"])
+            return
+
+        ## queue initial metadata while extraction is running, the writer merges it with the final update if both are pending
+        storeInitialMetadata(job.source, job.size, job.contentHash, writer=self.writer)
+
+        extractionFuture = trackFuture("extract", self.extractionPool.submit(extractPdf, job.source))
+        extractionFuture.add_done_callback(lambda future: self.handOff(self.onExtracted, job, future))
+
+    ## submit a pdf url to the pipeline
+    def submitUrl(self, url):
+        job = PipelineJob(url, isUrl=True)
+        self.track(job)
+
+        extractionFuture = trackFuture("extract", self.extractionPool.submit(extractUrl, url))
+        extractionFuture.add_done_callback(lambda future: self.handOff(self.onExtracted, job, future))
+        return job.result
+
+    ## submit a pdf already downloaded by the async url front end (asyncIngestion.py)
+    def submitDownload(self, url, kind, data):
+        """
+        kind and data are ("memory", bytes) or ("file", spoolPath), the extraction worker deletes the spool file.
+        """
+        job = PipelineJob(url, isUrl=True)
+        self.track(job)
+
+        extractionFuture = trackFuture("extract", self.extractionPool.submit(extractDownload, kind, data))
+        extractionFuture.add_done_callback(lambda future: self.handOff(self.onExtracted, job, future))
+        return job.result
+
+    ## keep track of a job until its result is set
+    def track(self, job):
+        with self.pendingLock:
+            self.pending.add(job.result)
+        job.result.add_done_callback(self.untrack)
+
+    def untrack(self, future):
+        with self.pendingLock:
+            self.pending.discard(future)
+
+    ## run a stage on the light threads, done callbacks of the process pool run on its single result thread
+    ## and anything slow there (compressing the text, gridfs writes) holds up the results of every worker
+    def handOff(self, callback, job, *args):
+        future = self.keywordPool.submit(callback, job, *args)
+        future.add_done_callback(lambda f: self.onStageError(callback, job, f))
+
+    ## a stage raised an exception it did not catch, fail the job so close() and the caller do not wait for it forever
+    def onStageError(self, callback, job, future):
+        exception = future.exception()
+        if exception is None:
+            return
+        logging.error(f"Error in {callback.__name__} for {job.source}: {exception}")
+        if not job.result.done():
+            job.result.set_exception(exception)
+
+    ## extraction finished, OCR pages without a text layer on the same process pool
+    def onExtracted(self, job, future):
+        try:
+            extracted = future.result()
+        except Exception as e:
+            logging.error(f"Error extracting {job.source}: {e}")
+            job.result.set_exception(e)
+            return
+
+        pageTexts = extracted["pageTexts"]
+        missingPages = extracted["missingPages"]
+        if not missingPages:
+            self.onPagesReady(job, pageTexts)
+            return
+
+        logging.info(f"No text found on {len(missingPages)} of {len(pageTexts)} pages, attempting OCR for {job.source}")
+        ocrFutures = [trackFuture("ocr", self.extractionPool.submit(ocrPage, job.source, pageNumber, job.contentHash)) for pageNumber in missingPages]
+        whenAll(ocrFutures, lambda futures: self.handOff(self.onOcrDone, job, pageTexts, missingPages, futures))
+
+    ## page level OCR finished, merge the pages back in order
+    def onOcrDone(self, job, pageTexts, missingPages, ocrFutures):
+        for pageNumber, future in zip(missingPages, ocrFutures):
+            try:
+                pageTexts[pageNumber] = future.result()
+            except Exception as e:
+                logging.error(f"Error extracting page {pageNumber} with OCR for {job.source}: {e}.")
+        self.onPagesReady(job, pageTexts)
+
+    ## text is complete, fan out to summariser and keyword stages
+    def onPagesReady(self, job, pageTexts):
+        text = "\f".join(pageTexts)
+        if not text.strip():
+            logging.warning(f"Failed to process {job.source}, no text extracted.") ## log failure
+            job.result.set_exception(ValueError(f"No text extracted from {job.source}"))
+            return
+
+        self.checkpoint(job, "extracted", {"text": text})
+        self.deduplicate(job, text)
+
+    ## look for an already processed near duplicate of the text, its results are reused instead of running the model
+    def deduplicate(self, job, text):
+        if not nearDuplicateEnabled or "summarised" in (job.journal or {}):
+            self.analyse(job, text)
+            return
+        ## minhash is numpy work and the lsh lookup one query, light enough for the keyword threads
+        dedupFuture = trackFuture("dedup", self.keywordPool.submit(findNearDuplicate, text, exclude=job.source))
+        dedupFuture.add_done_callback(lambda future: self.onDeduplicated(job, text, future))
+
+    def onDeduplicated(self, job, text, future):
+        try:
+            job.signature, match = future.result()
+        except Exception as e:
+            logging.error(f"Error looking up near duplicates of {job.source}: {e}") ## processed as a new document
+            self.analyse(job, text)
+            return
+        if match is None:
+            self.analyse(job, text)
+            return
+
+        logging.info(f"{job.source} is a near duplicate of {match['nearDuplicateOf']} (similarity {match['similarity']}), reusing its results.")
+        incrementCounter("nearDuplicate")
+        job.nearDuplicate = match
+        job.lengthCategory = partitionText(text)[0]
+        job.summaryRoute = match.get("summaryRoute")
+        self.onAnalysed(job, text, completedFuture(match.get("summary")), completedFuture(matchScores(match)))
+
+    ## summarise and extract keywords, reusing the results an earlier run already recorded
+    def analyse(self, job, text):
+        journal = job.journal or {}
+        job.lengthCategory = partitionText(text)[0]
+        job.summaryRoute = journal.get("summaryRoute") or chooseSummaryRoute(text, job.lengthCategory)
+        try:
+            if "summarised" in journal:
+                summaryFuture = completedFuture(journal.get("summary"))
+            elif job.summaryRoute == "extractive":
+                ## short documents skip the model, sentence scoring is light enough for the keyword threads
+                summaryFuture = trackFuture("extractive", self.keywordPool.submit(extractiveSummary, text, vectorizer=self.keywordModel))
+            else:
+                summaryFuture = trackFuture("summarise", self.batcher.submit(text))
+        except Exception as e:
+            logging.error(f"Error queueing {job.source} for summarisation: {e}")
+            job.result.set_exception(e)
+            return
+        if "summarised" not in journal:
+            summaryFuture.add_done_callback(lambda f: self.checkpointFuture(job, "summarised", f, lambda summary: {"summary": summary, "summaryRoute": job.summaryRoute}))
+
+        ## keywords are (term, score) pairs until they are persisted
+        if "keywords" in journal:
+            keywordFuture = completedFuture([(item["keyword"], item["score"]) for item in journal.get("keywordScores", [])])
+        else:
+            if self.keywordBatcher is not None:
+                keywordFuture = trackFuture("keywords", self.keywordBatcher.submit(text))
+            else:
+                keywordFuture = trackFuture("keywords", self.keywordPool.submit(extractKeywords, text, withScores=True))
+            keywordFuture.add_done_callback(lambda f: self.checkpointFuture(job, "keywords", f, lambda scores: {"keywordScores": keywordScoreDocs(scores)}))
+        ## the last of the two finishes on the model worker or the keyword batcher, neither should persist
+        whenAll([summaryFuture, keywordFuture], lambda futures: self.handOff(self.onAnalysed, job, text, *futures))
+
+    ## record a finished stage of a local pdf in its journal
+    def checkpoint(self, job, stage, fields=None):
+        if job.isUrl:
+            return
+        try:
+            markStage(job.source, stage, job.contentHash, fields, writer=self.writer)
+        except Exception as e:
+            logging.error(f"Error recording stage {stage} for {job.source}: {e}") ## the document still carries on
+
+    ## record a stage once its future finished, empty results (failures) are redone on the next run
+    def checkpointFuture(self, job, stage, future, fields):
+        if future.exception() is None and future.result():
+            self.checkpoint(job, stage, fields(future.result()))
+
+    ## summary and keywords finished, hand over to db stage
+    def onAnalysed(self, job, text, summaryFuture, keywordFuture):
+        try:
+            summary = summaryFuture.result()
+            keywords = keywordFuture.result()
+        except Exception as e:
+            logging.error(f"Error analysing {job.source}: {e}")
+            job.result.set_exception(e)
+            return
+        if not summary:
+            ## the batcher resolves failed summaries with "", nothing is persisted so the next run redoes it
+            logging.error(f"Failed to summarise {job.source}, empty summary.")
+            job.result.set_exception(ValueError(f"Empty summary for {job.source}"))
+            return
+
+        try:
+            writeFuture = trackFuture("db", self.persist(job, text, summary, keywords)) ## blocks only when the writer queue is full
+        except Exception as e:
+            logging.error(f"Error queueing {job.source} for MongoDB: {e}")
+            job.result.set_exception(e)
+            return
+        writeFuture.add_done_callback(lambda future: self.onPersisted(job, future))
+
+    ## queue the processed document on the bulk writer
+    def persist(self, job, text, summary, scores):
+        keywords = [word for word, score in scores]
+        keywordScores = keywordScoreDocs(scores) ## stored so search.py ranks without recomputing tfidf
+        if job.isUrl:
+            document = {
+                "url": job.source,
+                "lengthCategory": job.lengthCategory,
+                "summaryRoute": job.summaryRoute,
+                "text": encodeText(text, job.source), ## compressed, inline or in GridFS
+                "summary": summary,
+                "keywords": keywords,
+                "keywordScores": keywordScores,
+                "processedAt": str(datetime.datetime.now()),
+                "processingTime": (datetime.datetime.now()-job.startTime).total_seconds(),
+            }
+            if job.nearDuplicate:
+                document.update(nearDuplicateFields(job.nearDuplicate))
+            return self.writer.insert(document)
+
+        if self.cache:
+            self.cache.put(job.contentHash, {"summary": summary, "keywords": keywords, "keywordScores": keywordScores,
+                                             "lengthCategory": job.lengthCategory, "summaryRoute": job.summaryRoute})
+        return updateProcessedDocument(job.source, summary, keywords, (datetime.datetime.now()-job.startTime),
+                                       job.contentHash, job.lengthCategory, writer=self.writer, summaryRoute=job.summaryRoute,
+                                       keywordScores=keywordScores, nearDuplicate=job.nearDuplicate)
+
+    def onPersisted(self, job, future):
+        try:
+            future.result()
+            self.checkpoint(job, "persisted") ## queued after the processed update, so it is written with or after it
+            if job.signature is not None and job.nearDuplicate is None:
+                self.dbPool.submit(indexDocument, job.source, job.contentHash, job.signature) ## before the result, close waits for it
+            logging.info(f"Processed {job.source} categorised as {job.lengthCategory}") ## log success
+            job.result.set_result(job.source)
+        except Exception as e:
+            logging.error(f"Error storing {job.source} in MongoDB: {e}")
+            job.result.set_exception(e)
+
+    ## wait for all submitted documents then stop every stage
+    def close(self):
+        while True:
+            with self.pendingLock:
+                pending = list(self.pending)
+            if not pending:
+                break
+            for future in pending:
+                future.exception() ## waits without raising
+
+        self.extractionPool.shutdown()
+        self.batcher.close()
+        if self.keywordBatcher is not None:
+            self.keywordBatcher.close()
+        self.keywordPool.shutdown()
+        self.dbPool.shutdown()
+        self.writer.close()
+        logging.info("Pipeline engine stopped.")
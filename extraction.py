@@ -0,0 +1,273 @@
+import os
+import fitz ## PyMuPDF
+import pytesseract 
+from pdfminer.high_level import extract_pages ## extract_pages from pdfminer
+from pdfminer.layout import LTTextContainer
+from config import partitionSizes, ocrDpi, ocrGrayscale, ocrWorkers, ocrCacheDir, extractionBackend ## importing from config.py
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import sys
+from metrics import stageTimer
+from httpClient import openPdfFromUrl, downloadToFile
+import re
+import logging
+
+## this module only holds the extraction side of the pipeline so that process pool
+## workers (engine.py) can import it without loading the summarisation model
+
+
+## function to hash the content of a file, the same file under another path gets the same hash
+def hashFile(filePath, chunkSize=1024*1024):
+    sha = hashlib.sha256()
+    with open(filePath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkSize), b""): ## read in chunks so large pdfs are not loaded at once
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+## function to OCR a single page, runs in a worker process
+def ocrPage(filePath, pageNumber, contentHash=None, dpi=ocrDpi, grayscale=ocrGrayscale):
+    """
+    renders one page at dpi and returns its tesseract text.
+    with a contentHash the result is kept in ocrCacheDir, so a retry after a crash only OCRs unfinished pages.
+    """
+    cachePath = None
+    if ocrCacheDir and contentHash:
+        cachePath = os.path.join(ocrCacheDir, f"{contentHash}-{pageNumber}-{dpi}-{'gray' if grayscale else 'rgb'}.txt")
+        if os.path.isfile(cachePath):
+            with open(cachePath, 'r', encoding='utf-8') as f:
+                return f.read()
+
+    with fitz.open(filePath) as pdf: ## opeing with PyMuPDF
+        colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+        pixmap = pdf.load_page(pageNumber).get_pixmap(dpi=dpi, colorspace=colorspace)
+        image = Image.frombytes("L" if grayscale else "RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        text = pytesseract.image_to_string(image) ## using the pytesseract module
+
+    if cachePath:
+        os.makedirs(ocrCacheDir, exist_ok=True)
+        tempPath = f"{cachePath}.{os.getpid()}.tmp"
+        with open(tempPath, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tempPath, cachePath) ## atomic, a crash never leaves a half written page
+    return text
+
+
+## function to OCR a set of pages of a pdf, fanned out over a process pool
+def ocrPages(filePath, pageNumbers, workers=ocrWorkers, dpi=ocrDpi, grayscale=ocrGrayscale):
+    """
+    returns a dict of page number -> OCR text.
+    pages that fail are logged and left out.
+    """
+    contentHash = hashFile(filePath) if ocrCacheDir else None
+    results = {}
+
+    if workers <= 1 or len(pageNumbers) <= 1:
+        for pageNumber in pageNumbers:
+            try:
+                results[pageNumber] = ocrPage(filePath, pageNumber, contentHash, dpi, grayscale)
+            except Exception as e:
+                logging.error(f"Error extracting page {pageNumber} with OCR for {filePath}: {e}.")
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(pageNumbers))) as executor:
+        futures = {executor.submit(ocrPage, filePath, pageNumber, contentHash, dpi, grayscale): pageNumber for pageNumber in pageNumbers}
+        for future in as_completed(futures):
+            pageNumber = futures[future]
+            try:
+                results[pageNumber] = future.result()
+            except Exception as e:
+                logging.error(f"Error extracting page {pageNumber} with OCR for {filePath}: {e}.")
+    return results
+
+
+## function to extract text using OCR for scanned files
+def extractTextWithOcr(filePath, pageNumbers=None, workers=ocrWorkers):
+    logging.info(f"Starting OCR extraction for file path: {filePath}.") ## log the start
+    text = "" ## variable to add tect
+    
+    try:
+        if pageNumbers is None:
+            with fitz.open(filePath) as pdf: ## opeing with PyMuPDF
+                pageNumbers = list(range(pdf.page_count))
+        results = ocrPages(filePath, pageNumbers, workers)
+        text = "\f".join(results.get(pageNumber, "") for pageNumber in pageNumbers)
+        logging.info(f"OCR extraction completed for {filePath}.") ## log the success
+    except Exception as e:
+        logging.error(f"Error extracting with OCR for {filePath}: {e}.") ## log the failure
+    return text
+
+
+## pymupdf backend, yields the text layer of each page
+def iterPagesPymupdf(filePath, startPage=0):
+    with fitz.open(filePath) as pdf:
+        for pageNumber in range(startPage, pdf.page_count):
+            yield pdf.load_page(pageNumber).get_text() ## only one page is loaded at a time
+
+
+## pdfminer backend, slower but handles some files pymupdf can not
+def iterPagesPdfminer(filePath, startPage=0):
+    for layout in extract_pages(filePath, page_numbers=range(startPage, sys.maxsize)):
+        yield "".join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+
+
+## extraction backends by name
+extractionBackends = {"pymupdf": iterPagesPymupdf, "pdfminer": iterPagesPdfminer}
+
+
+## function to stream the text layer of a local pdf page by page
+def iterPageTexts(filePath, backend=extractionBackend):
+    """
+    generator yielding one string per page, pages without a text layer yield empty strings.
+    if the backend fails on a problem file, the remaining pages are read with pdfminer.
+    example(how to use):
+    for pageNumber, pageText in enumerate(iterPageTexts(filePath)):
+        ## downstream work can start before the whole document is extracted
+    """
+    pageCount = 0 ## pages already yielded
+    try:
+        for pageText in extractionBackends[backend](filePath):
+            yield pageText
+            pageCount += 1
+        return
+    except Exception as e:
+        if backend == "pdfminer":
+            raise
+        logging.warning(f"{backend} failed on page {pageCount} of {filePath}: {e}, falling back to pdfminer.")
+
+    yield from iterPagesPdfminer(filePath, pageCount)
+
+
+## function to extract the text layer of every page of a local pdf
+def extractPageTexts(filePath, backend=extractionBackend):
+    """
+    returns one string per page, pages without a text layer are empty strings.
+    """
+    return list(iterPageTexts(filePath, backend))
+
+
+## function to list pages that have no text layer and need OCR
+def findMissingPages(pageTexts):
+    return [pageNumber for pageNumber, pageText in enumerate(pageTexts) if not pageText.strip()]
+
+
+## function to extract text from local pdf file
+def extractTextFromPdf(filePath, ocrWorkers=ocrWorkers):
+    logging.info(f"Starting extraction for file path: {filePath}.") ## log the start
+    
+    try:
+        pageTexts = extractPageTexts(filePath)
+        logging.info(f"Extraction completed for {filePath}.")
+
+        ## only pages without a text layer are OCR'd, so mixed scanned/digital pdfs keep both
+        missingPages = findMissingPages(pageTexts)
+        if missingPages:
+            logging.info(f"No text found on {len(missingPages)} of {len(pageTexts)} pages, attempting OCR for {filePath}")
+            with stageTimer("ocr"):
+                results = ocrPages(filePath, missingPages, ocrWorkers)
+            for pageNumber, pageText in results.items():
+                pageTexts[pageNumber] = pageText
+        
+        return "\f".join(pageTexts)  ## returning text
+    
+    except Exception as e:
+        logging.error(f"Error extracting text for {filePath}: {e}")
+        return ""
+
+
+## function to download pdf from url and save it locally
+def downloadPdfFromUrl(url):
+    logging.info(f"Starting to download PDF from URL: {url}")
+    
+    try: 
+        ## clean the filename from url
+        fileName = re.sub(r'[^A-Za-z0-9]','_', url.split("/")[-1]) ## checking and removing unwanted characters which cant be used in filename
+        filePath = os.path.join(os.getcwd(), fileName) ## joining current working directory and filename
+
+        downloadToFile(url, filePath) ## streamed to the file, not buffered in memory
+
+        logging.info(f"Downloaded pdf: {filePath}") ## log successful download
+        return filePath
+    
+    except Exception as e:
+        logging.error(f"Error downloadig pdf from {url}: {e} ") ## log any errors
+        return None
+
+
+## function to extract text from pdf given its url(download pdf)
+def extractTextFromUrl(url):
+    logging.info(f"Starting to extract text from URL stream: {url}")
+    try:
+        ## pooled session with timeouts and retries, large pdfs are spooled to disk
+        with openPdfFromUrl(url) as pdfDocument:
+            ## extract text from document page by page
+            text = "\f".join(page.get_text() for page in pdfDocument)
+        
+        if not text.strip():
+            logging.warning(f"No text extracted from URL: {url}") ## log failure
+
+        logging.info(f"Successfully extracted text from URL:{url}") ## log success
+        return text
+
+    except Exception as e:
+        logging.error(f"Error extracting text from URL {url}:{e}") ## log error
+        return ""
+    
+
+## function to partition text into categories
+def partitionText(text):
+    logging.info(f"Starting partitioning text into categories.")
+    pages = text.split("\f") ## every extraction path (text layer, OCR, urls) joins pages with a form feed
+
+    ## partitioning pasges based on partitionSizes(config.py)
+    if len(pages) <= partitionSizes["short"]:
+        lengthCategory = "short"
+    elif len(pages) <= partitionSizes["medium"]:
+        lengthCategory = "medium"
+    else:
+        lengthCategory = "long"
+    logging.info(f"Succesfully partitioned as {lengthCategory} with {len(pages)} pages.") 
+    
+    return lengthCategory, pages
+
+
+## function run inside the engine's process pool to extract a local pdf
+def extractPdf(filePath):
+    """
+    returns the text layer of every page and the pages that still need OCR.
+    the engine submits OCR of the missing pages (ocrPage) to the same process pool.
+    the pages are collected into a list here, a generator can not be returned from the worker process, so the
+    engine's stages start once the whole document is extracted and the document's text is held in memory in full
+    (deduplication, partitioning and the summariser need all of it anyway). iterPageTexts streams pages only to
+    callers in the same process.
+    """
+    pageTexts = extractPageTexts(filePath)
+    return {"pageTexts": pageTexts, "missingPages": findMissingPages(pageTexts)}
+
+
+## function run inside the engine's process pool to extract a pdf from url
+def extractUrl(url):
+    """
+    returns the text of a pdf streamed from url in the same shape as extractPdf.
+    """
+    return {"pageTexts": [extractTextFromUrl(url)], "missingPages": []}
+
+
+## function run inside the engine's process pool to extract a pdf downloaded by the async url front end
+def extractDownload(kind, data):
+    """
+    kind and data are what downloadToSpool returns, ("memory", bytes) or ("file", spoolPath).
+    the worker owns the spool file and deletes it once the text is extracted.
+    """
+    try:
+        if kind == "file":
+            pdfDocument = fitz.open(data) ## large pdfs were spooled to disk
+        else:
+            pdfDocument = fitz.open(stream=data, filetype="pdf")
+        with pdfDocument:
+            pageTexts = [page.get_text() for page in pdfDocument]
+    finally:
+        if kind == "file":
+            os.remove(data)
+    return {"pageTexts": pageTexts, "missingPages": []}
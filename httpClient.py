@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+import fitz ## PyMuPDF
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import httpPoolSize, httpConnectTimeout, httpReadTimeout, httpRetries, httpBackoff, spoolThreshold ## importing from config.py
+
+## shared session of this process, created on first use
+session = None
+sessionPid = None ## a forked worker must not reuse the parent's sockets
+sessionLock = threading.Lock()
+
+
+## function returning the pooled keep-alive session with retries
+def getSession():
+    global session, sessionPid
+    with sessionLock:
+        if session is None or sessionPid != os.getpid():
+            retry = Retry(total=httpRetries, backoff_factor=httpBackoff,
+                          status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET", "HEAD"))
+            adapter = HTTPAdapter(pool_connections=httpPoolSize, pool_maxsize=httpPoolSize, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            sessionPid = os.getpid()
+    return session
+
+
+## function to stream a url into memory or a spool file
+def downloadToSpool(url, threshold=spoolThreshold):
+    """
+    returns ("memory", bytearray) for small responses, or ("file", path) once the body grows past threshold.
+    the caller owns the spool file and has to delete it.
+    """
+    with getSession().get(url, stream=True, timeout=(httpConnectTimeout, httpReadTimeout)) as response:
+        response.raise_for_status() ## check for http errors
+
+        buffer = bytearray()
+        spool = None
+        try:
+            for chunk in response.iter_content(chunk_size=64*1024):
+                if spool is not None:
+                    spool.write(chunk)
+                    continue
+                buffer.extend(chunk)
+                if len(buffer) > threshold:
+                    ## too large for memory, move what we have to disk and keep streaming there
+                    spool = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+                    spool.write(buffer)
+                    buffer = None
+        except Exception:
+            if spool is not None:
+                spool.close()
+                os.remove(spool.name)
+            raise
+
+    if spool is None:
+        return "memory", buffer
+
+    spool.close()
+    logging.info(f"Spooled download of {url} to {spool.name}")
+    return "file", spool.name
+
+
+## function to stream a url straight to a file
+def downloadToFile(url, filePath):
+    with getSession().get(url, stream=True, timeout=(httpConnectTimeout, httpReadTimeout)) as response:
+        response.raise_for_status() ## check for errors
+        with open(filePath, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=64*1024):
+                f.write(chunk)
+    return filePath
+
+
+## context manager opening a pdf from url without extra copies of the body
+@contextmanager
+def openPdfFromUrl(url):
+    """
+    example(how to use):
+    with openPdfFromUrl(url) as pdfDocument:
+        text = "".join(page.get_text() for page in pdfDocument)
+    """
+    kind, data = downloadToSpool(url)
+    try:
+        if kind == "file":
+            pdfDocument = fitz.open(data) ## large pdfs are opened from disk
+        else:
+            pdfDocument = fitz.open(stream=data, filetype="pdf") ## small pdfs straight from the buffer
+        with pdfDocument:
+            yield pdfDocument
+    finally:
+        if kind == "file":
+            os.remove(data)
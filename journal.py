@@ -0,0 +1,77 @@
+import datetime
+import logging
+from database import getCollection
+from textStore import encodeText, decodeText
+from config import journalEnabled, journalKeepText ## importing from config.py
+
+## stages of a document in the order they finish, recorded under "journal" next to the metadata record
+## {"journal": {"extracted": {"at": datetime, "contentHash": ...}, "summarised": {...}, "keywords": {...}, "persisted": {...},
+##              "summary": ..., "summaryRoute": ..., "keywordScores": ...}, "text": extracted text}
+## every stage records the content it was done for, so stages of a file that changed in place are ignored.
+journalStages = ("extracted", "summarised", "keywords", "persisted")
+stageFields = {"extracted": ("text",), "summarised": ("summary", "summaryRoute"), "keywords": ("keywordScores",), "persisted": ()}
+
+
+## function to load the finished stages of a file for its current content, None if there are none
+def loadJournal(filePath, contentHash, collection=None):
+    """
+    returns {stage: timestamp, ...} with the intermediate results of those stages (text, summary, keywordScores).
+    """
+    if not journalEnabled:
+        return None
+    collection = collection if collection is not None else getCollection()
+    document = collection.find_one({"filePath": filePath}, {"_id": 0, "journal": 1, "text": 1, "summary": 1})
+    if not document or not document.get("journal"):
+        return None
+
+    stored = dict(document["journal"], text=document.get("text"))
+    journal = {}
+    for stage in journalStages:
+        record = stored.get(stage)
+        if not isinstance(record, dict) or record.get("contentHash") != contentHash:
+            continue ## not done, or done for content the file no longer has
+        if stage == "persisted" and not document.get("summary"):
+            continue ## persisted with a failed (empty) summary by an earlier version, redone
+        journal[stage] = record.get("at")
+        for key in stageFields[stage]:
+            if key in stored:
+                journal[key] = stored[key]
+    if not journal:
+        return None
+
+    if "persisted" in journal:
+        journal.pop("text", None) ## finished files are skipped, no need to decompress
+    elif journal.get("text") is not None:
+        journal["text"] = decodeText(journal["text"])
+    return journal
+
+
+## function to get the last finished stage of a journal, None when nothing finished
+def lastStage(journal):
+    finished = [stage for stage in journalStages if journal and stage in journal]
+    return finished[-1] if finished else None
+
+
+## function to record a finished stage and its intermediate result
+def markStage(filePath, stage, contentHash, fields=None, writer=None):
+    """
+    fields are stored under "journal" (e.g. {"summary": summary}), except "text" which is stored on the document.
+    field names must not be stage names, the stage key holds its timestamp.
+    with a writer the checkpoint is queued and merged with the other pending writes of the document.
+    """
+    if not journalEnabled:
+        return None
+    update = {f"journal.{stage}": {"at": datetime.datetime.now(), "contentHash": contentHash}}
+    for key, value in (fields or {}).items():
+        if key == "text":
+            if journalKeepText:
+                update["text"] = encodeText(value, filePath) ## kept so a later failure does not redo extraction and OCR
+        else:
+            update[f"journal.{key}"] = value
+
+    if writer is not None:
+        return writer.upsert({"filePath": filePath}, update)
+    try:
+        getCollection().update_one({"filePath": filePath}, {"$set": update}, upsert=True)
+    except Exception as e:
+        logging.error(f"Failed to record stage {stage} for {filePath}: {e}")
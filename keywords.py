@@ -1,6 +1,52 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+from config import keywordModelPath, extractiveSentences, keywordBatchSize, keywordMaxWait ## importing from config.py
+from concurrent.futures import Future
+import numpy as np
+import os
+import re
+import time
+import threading
+import logging
 
-def extractKeywords(text, top_n=10, stop_words="english"):
+## fitted model shared by every caller in the process, loaded on first use
+keywordModel = None
+keywordModelLoaded = False
+keywordModelLock = threading.Lock()
+
+
+## function to pick the top_n terms of one sparse tfidf row
+def topTerms(row, featureNames, top_n):
+    """
+    uses argpartition on the non zero scores only, instead of densifying and sorting the whole vocabulary.
+    returns a list of (term, score) sorted by score.
+    """
+    scores = row.data
+    indices = row.indices
+    if len(scores) > top_n:
+        top = np.argpartition(-scores, top_n-1)[:top_n] ## unordered top_n
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")] ## order only the selected terms
+    return [(featureNames[indices[i]], float(scores[i])) for i in top]
+
+
+## function returning the feature names of a fitted vectorizer, built once per model
+def getFeatureNames(vectorizer):
+    """
+    get_feature_names_out builds a new array of the whole vocabulary on every call,
+    which costs far more than the transform of one document with a corpus model.
+    """
+    featureNames = getattr(vectorizer, "featureNames", None)
+    if featureNames is None:
+        featureNames = vectorizer.featureNames = vectorizer.get_feature_names_out()
+    return featureNames
+
+
+## function to turn (term, score) pairs into the keywordScores stored on a document
+def keywordScoreDocs(scores):
+    return [{"keyword": word, "score": round(score, 6)} for word, score in scores]
+
+
+def extractKeywords(text, top_n=10, stop_words="english", vectorizer=None, withScores=False):
     ## check if input text is valid
     if not isinstance(text, str):
         raise ValueError("Input text must be a string.")
@@ -14,20 +60,225 @@ def extractKeywords(text, top_n=10, stop_words="english"):
         raise ValueError("top_n must be a positive integer.")
     
     try:
-        ## initialise tfid vector with stop words and ngram range
-        vectorizer = TfidfVectorizer(stop_words=stop_words, ngram_range=(1,2))
+        if vectorizer is not None:
+            ## fitted corpus model, idf is already known so only transform
+            TfidMatrix = vectorizer.transform([text])
+            if TfidMatrix.nnz == 0:
+                vectorizer = None ## no known terms, fall back to fitting on the document
+        
+        if vectorizer is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer ## imported on first use, sklearn is slow to import
+
+            ## initialise tfid vector with stop words and ngram range
+            vectorizer = TfidfVectorizer(stop_words=stop_words, ngram_range=(1,2))
 
-        ## create tfid matrix
-        TfidMatrix = vectorizer.fit_transform([text])
+            ## create tfid matrix
+            TfidMatrix = vectorizer.fit_transform([text])
 
-        ## create list of tuples for (term,score) and sort by score
-        scores = zip(vectorizer.get_feature_names_out(), TfidMatrix.toarray()[0])
-        sortedScores = sorted(scores, key=lambda x:x[1], reverse= True)
+        ## pick top_n (term,score) from the sparse row
+        scores = topTerms(TfidMatrix.tocsr()[0], getFeatureNames(vectorizer), top_n)
 
-        ## return top_n keywords
-        return [word for word, score in sortedScores[:top_n]]
+        ## return top_n keywords, with their tfidf scores for search ranking (search.py)
+        if withScores:
+            return scores
+        return [word for word, score in scores]
     
     except Exception as e:
         print(f"An error occured while extracting keywords: {e}.")
         return []
 
+
+## function to summarise a short document by picking its highest scoring sentences
+def extractiveSummary(text, sentenceCount=extractiveSentences, stop_words="english", vectorizer=None):
+    """
+    fast path for short documents instead of the summarisation model.
+    every sentence is scored by the sum of its tfidf weights (the saved corpus model when given,
+    otherwise idf fitted over the document's own sentences) and the top sentenceCount are
+    returned in their original order.
+    """
+    if not isinstance(text, str) or not text.strip():
+        print("Warning: Input text is empty or contains only whitespace.")
+        return ""
+
+    sentences = [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence.strip()]
+    if len(sentences) <= sentenceCount:
+        return " ".join(sentences)
+
+    try:
+        TfidMatrix = vectorizer.transform(sentences) if vectorizer is not None else None
+        if TfidMatrix is None or TfidMatrix.nnz == 0:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            TfidMatrix = TfidfVectorizer(stop_words=stop_words).fit_transform(sentences)
+
+        scores = np.asarray(TfidMatrix.sum(axis=1)).ravel()
+        top = np.argpartition(-scores, sentenceCount-1)[:sentenceCount]
+        return " ".join(sentences[i] for i in sorted(top)) ## keep the document order
+
+    except Exception as e:
+        print(f"An error occured while extracting summary sentences: {e}.")
+        return ""
+
+
+## function to fit a tfidf model once over a corpus
+def fitKeywordModel(texts, stop_words="english"):
+    """
+    fits idf over every text in the corpus (any iterable of strings).
+    the returned vectorizer can be passed to extractKeywords or extractKeywordsBatch.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(stop_words=stop_words, ngram_range=(1,2))
+    vectorizer.fit(texts)
+    getFeatureNames(vectorizer) ## saved with the model
+    logging.info(f"Fitted keyword model with {len(vectorizer.vocabulary_)} terms.")
+    return vectorizer
+
+
+## function to save a fitted keyword model
+def saveKeywordModel(vectorizer, path=keywordModelPath):
+    import joblib
+    joblib.dump(vectorizer, path)
+    logging.info(f"Saved keyword model to {path}.")
+
+
+## function to load a saved keyword model, returns None if there is none
+def loadKeywordModel(path=keywordModelPath):
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        import joblib
+        vectorizer = joblib.load(path)
+        getFeatureNames(vectorizer) ## models saved before the names were kept
+        logging.info(f"Loaded keyword model from {path}.")
+        return vectorizer
+    except Exception as e:
+        logging.error(f"Error loading keyword model from {path}: {e}")
+        return None
+
+
+## function returning the shared keyword model of this process
+def getKeywordModel():
+    global keywordModel, keywordModelLoaded
+    with keywordModelLock:
+        if not keywordModelLoaded:
+            keywordModel = loadKeywordModel()
+            keywordModelLoaded = True
+    return keywordModel
+
+
+## function to extract keywords of many documents in one sparse operation
+def extractKeywordsBatch(texts, top_n=10, vectorizer=None, stop_words="english", withScores=False):
+    """
+    returns a list of keyword lists ((term, score) pairs with withScores) in the same order as texts.
+    without a vectorizer, idf is fitted once over the given texts. with one, documents without any
+    known term fit their own model like extractKeywords does.
+    """
+    if not isinstance(top_n, int) or top_n <= 0:
+        raise ValueError("top_n must be a positive integer.")
+
+    keywords = [[] for _ in texts]
+    validIndexes = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+    if not validIndexes:
+        return keywords
+
+    try:
+        validTexts = [texts[i] for i in validIndexes]
+        fitted = vectorizer is None
+        if fitted:
+            vectorizer = fitKeywordModel(validTexts, stop_words)
+
+        ## one transform for the whole batch, rows stay sparse
+        TfidMatrix = vectorizer.transform(validTexts).tocsr()
+        featureNames = getFeatureNames(vectorizer)
+
+        for row, index in enumerate(validIndexes):
+            if TfidMatrix[row].nnz == 0 and not fitted:
+                scores = extractKeywords(texts[index], top_n, stop_words, withScores=True) ## no known terms
+            else:
+                scores = topTerms(TfidMatrix[row], featureNames, top_n)
+            keywords[index] = scores if withScores else [word for word, score in scores]
+
+    except Exception as e:
+        print(f"An error occured while extracting keywords: {e}.")
+
+    return keywords
+
+
+## class collecting documents from many threads and extracting their keywords in batches
+class KeywordBatcher:
+    """
+    used by the pipeline engine with a fitted corpus model: pending documents are transformed together
+    by extractKeywordsBatch when batchSize documents are waiting or the oldest has waited maxWait seconds.
+    futures resolve to (term, score) pairs.
+    example(how to use):
+    batcher = KeywordBatcher(getKeywordModel())
+    future = batcher.submit(text)
+    scores = future.result()
+    batcher.close()
+    """
+    def __init__(self, vectorizer, top_n=10, batchSize=keywordBatchSize, maxWait=keywordMaxWait):
+        self.vectorizer = vectorizer
+        self.top_n = top_n
+        self.batchSize = batchSize
+        self.maxWait = maxWait
+        self.pending = [] ## (enqueuedAt, text, future)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="keyword-batcher", daemon=True)
+        self.thread.start()
+
+    ## add a document and get a future for its keywords
+    def submit(self, text):
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("KeywordBatcher is closed.")
+            self.pending.append((time.monotonic(), text, future))
+            self.condition.notify()
+        return future
+
+    ## take the next batch once it is full, expired or the batcher is closing, None when stopped
+    def nextBatch(self):
+        with self.condition:
+            while True:
+                if self.pending and (len(self.pending) >= self.batchSize or self.closed
+                                     or time.monotonic()-self.pending[0][0] >= self.maxWait):
+                    batch = self.pending[:self.batchSize]
+                    del self.pending[:self.batchSize]
+                    return batch
+                if self.closed:
+                    return None
+                self.condition.wait(max(0, self.pending[0][0]+self.maxWait-time.monotonic()) if self.pending else None)
+
+    def run(self):
+        while True:
+            batch = self.nextBatch()
+            if batch is None:
+                return
+            try:
+                results = extractKeywordsBatch([text for enqueuedAt, text, future in batch], self.top_n, self.vectorizer, withScores=True)
+            except Exception as e: ## invalid top_n
+                for enqueuedAt, text, future in batch:
+                    future.set_exception(e)
+                continue
+            for (enqueuedAt, text, future), scores in zip(batch, results):
+                future.set_result(scores)
+
+    ## extract everything still pending and stop the thread
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+## build the keyword model from a folder of pdfs: python keywords.py <folder>
+if __name__ == "__main__":
+    import sys
+    from extraction import extractTextFromPdf
+
+    folderPath = sys.argv[1]
+    pdfFiles = [os.path.join(folderPath, file) for file in os.listdir(folderPath) if file.lower().endswith(".pdf")]
+
+    ## generator so only one document's text is held at a time while fitting
+    texts = (extractTextFromPdf(filePath) for filePath in pdfFiles)
+    saveKeywordModel(fitKeywordModel(texts))
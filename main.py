@@ -1,11 +1,18 @@
 import os
 from parsing import processPdf, processUrl, processJson, processPdfsConcurrently
 from config import pdfFolderPath
+from metrics import startMetricsServer
+from database import ensureIndexes
 import logging
 import time
 
 def main():
     logging.info(f"Pdf Processing Pipeline Started.")
+    startMetricsServer() ## only when metricsPort is set in config.py
+    try:
+        ensureIndexes() ## filePath, contentHash, url, processedAt and keywords
+    except Exception as e:
+        logging.error(f"Could not ensure MongoDB indexes: {e}")
     print("PDF Processing Pipeline")
     print("=======================")
     print("Choose an option")
@@ -62,7 +69,7 @@ def main():
             jsonFilePath = input("Enter the path to the JSON file: ")
             logging.info(f"User selected to process JSON file: {jsonFilePath}")
             
-            if os.path.isfile(jsonFilePath) and jsonFilePath.lower().endswith(".json"):
+            if os.path.isfile(jsonFilePath) and jsonFilePath.lower().endswith((".json", ".jsonl")):
                 processJson(jsonFilePath)
                 logging.info(f"Completed processing JSON file: {jsonFilePath}")
                 print(f"Processing JSON file completed.")
@@ -0,0 +1,154 @@
+import os
+import json
+import threading
+import datetime
+import logging
+
+## reads JSON manifests one entry at a time, so memory does not grow with the manifest size
+decoder = json.JSONDecoder()
+whitespace = " \t\r\n"
+
+
+## function to iterate over the (key, item) entries of a manifest
+def iterManifest(filePath):
+    """
+    .jsonl manifests hold one entry per line, either a {"key": item} object or a bare item
+    (keyed by its line number). any other file is read as the existing {"key": item, ...} format.
+    example(how to use):
+    for key, item in iterManifest("manifest.jsonl"):
+        print(key, item)
+    """
+    if filePath.lower().endswith(".jsonl"):
+        return iterJsonLines(filePath)
+    return iterJsonObject(filePath)
+
+
+## function to read a JSON lines manifest
+def iterJsonLines(filePath):
+    with open(filePath, 'r') as f:
+        for lineNumber, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line) ## raises json.JSONDecodeError like json.load
+            if isinstance(entry, dict):
+                yield from entry.items()
+            else:
+                yield str(lineNumber), entry
+
+
+## function to get the job kind of a manifest item, "url", "pdf" or None when it is invalid
+def classifyEntry(item):
+    if isinstance(item, str) and item.lower().startswith('http'):
+        return "url"
+    if isinstance(item, str) and os.path.isfile(item):
+        return "pdf"
+    return None
+
+
+## characters that can continue a number
+numberCharacters = set("0123456789.eE+-")
+
+
+## class incrementally decoding one JSON object from a file read in chunks
+class ObjectReader:
+    def __init__(self, f, chunkSize=64*1024):
+        self.f = f
+        self.chunkSize = chunkSize
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    ## read more of the file, dropping what was already decoded
+    def fill(self):
+        chunk = self.f.read(self.chunkSize)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    ## next non whitespace character, without consuming it
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in whitespace:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ""
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(f"Expected one of {characters!r}", self.buffer, self.position)
+        self.position += 1
+        return character
+
+    ## decode the next JSON value, reading more until it is complete
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+                ## a number that runs to the end of the buffer may continue in the next chunk ("1." | "5e10"),
+                ## raw_decode stops before a trailing "." or "e" so the rest of the buffer is checked too
+                incomplete = isinstance(value, (int, float)) and not isinstance(value, bool) and \
+                    all(character in numberCharacters for character in self.buffer[end:])
+                if not incomplete or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+## function to read the {"key": item, ...} manifest one pair at a time
+def iterJsonObject(filePath):
+    with open(filePath, 'r') as f:
+        reader = ObjectReader(f)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            yield key, reader.value()
+            if reader.expect(",}") == "}":
+                return
+
+
+## class appending one JSON line per processed manifest entry
+class ResultLog:
+    """
+    results are written as they finish instead of being kept until the end of the run,
+    lines are flushed so a crashed run still shows which entries completed.
+    example(how to use):
+    with ResultLog("results.jsonl") as resultLog:
+        resultLog.write(source, "success")
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def write(self, source, status, error=None):
+        record = {"source": source, "status": status, "finishedAt": str(datetime.datetime.now())}
+        if error is not None:
+            record["error"] = str(error)
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        logging.info(f"Results written to {self.path}.")
@@ -2,7 +2,13 @@ import psutil
 import time
 import threading
 import logging
+import json
+import bisect
+import itertools
 from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import metricsSampleInterval, metricsPort, metricsOutputPath ## importing from config.py
 
 ## setup logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,19 +28,78 @@ def getActiveThreadCount():
         return 0
     
 
+## class sampling cpu, rss and thread count in the background
+class ResourceSampler:
+    """
+    background thread that records a sample every interval seconds, so callers never block on psutil.
+    cpu percent is measured between two samples instead of sleeping for a second.
+    """
+    def __init__(self, interval=metricsSampleInterval):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.latest = {}
+        self.peakRss = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="resource-sampler", daemon=True)
+
+        psutil.cpu_percent(interval=None) ## first call only sets the starting point
+        self.sample()
+
+    ## take one sample
+    def sample(self):
+        rss = self.process.memory_info().rss
+        self.peakRss = max(self.peakRss, rss)
+        self.latest = {
+            "cpuPercent": psutil.cpu_percent(interval=None), ## since the previous sample, does not sleep
+            "memoryPercent": psutil.virtual_memory().percent,
+            "rssBytes": rss,
+            "peakRssBytes": self.peakRss,
+            "threads": threading.active_count(),
+            "sampledAt": time.time(),
+        }
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error(f"Error sampling resource usage: {e}.")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+
+## shared sampler, started on first use
+resourceSampler = None
+resourceSamplerLock = threading.Lock()
+
+
+## function returning the running resource sampler
+def getResourceSampler():
+    global resourceSampler
+    with resourceSamplerLock:
+        if resourceSampler is None:
+            resourceSampler = ResourceSampler().start()
+    return resourceSampler
+
+
 ## function to log current resource usage(cpu and memory)
 def logResourceUsage():
     """
-    returns the cpu and the memory usage
+    logs the latest cpu and memory sample of the background sampler, it does not block.
     """
     try:
+        sample = getResourceSampler().latest
+
         ## get cpu usage
-        cpuPercent = psutil.cpu_percent(interval=1) ## get cpu usage
-        logging.info(f"CPU Usage: {cpuPercent}%")
+        logging.info(f"CPU Usage: {sample['cpuPercent']}%")
         
         ## get memory usage
-        memoryInfo = psutil.virtual_memory() ## get memory usage
-        logging.info(f"Memory Usage: {memoryInfo.percent}%")
+        logging.info(f"Memory Usage: {sample['memoryPercent']}%, RSS: {sample['rssBytes']/1024/1024:.1f} MB, Threads: {sample['threads']}")
     
     ## error logging
     except Exception as e:
@@ -42,23 +107,213 @@ def logResourceUsage():
 
 
 ## function to track execution time()
-def trackExecutionTime(func):
+def trackExecutionTime(func=None, stage=None):
     """
     this is a decorator function used to check execution tim eof a function.
+    the time is also recorded in the latency histogram of stage (the function name by default).
     example(how to use):
     @trackExecutionTime ## call fucntion first
     def myFunction():
         my function code
     
+    @trackExecutionTime(stage="extract") ## record under a stage name
+    def extract():
+        my function code
+
     myFunction() ## time will get logged because @trackExecutionTime is added before creating myFunction.
     """
+    if func is None:
+        return lambda func: trackExecutionTime(func, stage)
+
     @wraps(func) ## using the wraps from functools
     def wrapper(*arge,**kwargs):
-        start_time = time.time() ## start time before function
-        result = func(*arge,**kwargs) ## call original function
-        end_time = time.time() ## end time after function finished
-        execution_time = end_time-start_time
-        ## logging execution time
-        logging.info(f"{func.__name__} processed in {execution_time:.2f} seconds.") ## print execution time
-        return result ## return the funnction result
-    return wrapper
\ No newline at end of file
+        start_time = time.perf_counter() ## start time before function
+        try:
+            return func(*arge,**kwargs) ## call original function and return its result
+        finally:
+            execution_time = time.perf_counter()-start_time
+            recordStage(stage or func.__name__, execution_time)
+            ## logging execution time
+            logging.info(f"{func.__name__} processed in {execution_time:.2f} seconds.") ## print execution time
+    return wrapper
+
+
+## class counting observations in fixed latency buckets
+class Histogram:
+    """
+    latency histogram with prometheus style cumulative buckets (seconds).
+    memory stays fixed however many observations are made, quantiles are estimated from the buckets.
+    """
+    bounds = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    ## estimate a quantile (0-1) by linear interpolation inside its bucket
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[index-1] if index else 0.0
+                upper = min(self.bounds[index], self.max) ## the last bucket is unbounded
+                return lower + (upper-lower) * (rank-seen) / count
+            seen += count
+        return self.max
+
+    def toDict(self):
+        return {
+            "count": self.count,
+            "sumSeconds": round(self.sum, 6),
+            "maxSeconds": round(self.max, 6),
+            "p50Seconds": self.quantile(0.5),
+            "p95Seconds": self.quantile(0.95),
+            "p99Seconds": self.quantile(0.99),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): count for bound, count in zip(self.bounds, itertools.accumulate(self.counts))},
+        }
+
+
+## per stage latency histograms (extract, ocr, summarise, keywords, db, ...), stage name -> Histogram
+stageHistograms = {}
+stageHistogramsLock = threading.Lock()
+
+
+## function to record how long one document spent in a stage
+def recordStage(stage, seconds):
+    with stageHistogramsLock:
+        histogram = stageHistograms.get(stage)
+        if histogram is None:
+            histogram = stageHistograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+
+## context manager to time a block of code as a stage
+@contextmanager
+def stageTimer(stage):
+    """
+    example(how to use):
+    with stageTimer("extract"):
+        text = extractTextFromPdf(filePath)
+    """
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        recordStage(stage, time.perf_counter()-startTime)
+
+
+## function to time a future from now until it finishes, for stages running on other workers
+def trackFuture(stage, future):
+    startTime = time.perf_counter()
+    future.add_done_callback(lambda f: recordStage(stage, time.perf_counter()-startTime))
+    return future
+
+
+## function returning a snapshot of the stage histograms as dicts
+def getStageTimings():
+    with stageHistogramsLock:
+        return {stage: histogram.toDict() for stage, histogram in stageHistograms.items()}
+
+
+## function to clear the recorded stage timings, e.g. between benchmark runs
+def resetStageTimings():
+    with stageHistogramsLock:
+        stageHistograms.clear()
+        eventCounters.clear()
+
+
+## counters of pipeline events (worker recycles, kills, isolated retries, ...), name -> count
+eventCounters = {}
+
+
+## function to count an event
+def incrementCounter(name, amount=1):
+    with stageHistogramsLock:
+        eventCounters[name] = eventCounters.get(name, 0) + amount
+
+
+## function returning a snapshot of the event counters
+def getCounters():
+    with stageHistogramsLock:
+        return dict(eventCounters)
+
+
+## function to export stage histograms and the latest resource sample as a JSON serialisable dict
+def exportMetricsJson():
+    return {"stages": getStageTimings(), "counters": getCounters(), "resources": getResourceSampler().latest}
+
+
+## function to export the same metrics in prometheus text format
+def exportPrometheus():
+    lines = ["# HELP pdf_pipeline_stage_seconds Time documents spent in each pipeline stage.",
+             "# TYPE pdf_pipeline_stage_seconds histogram"]
+    for stage, histogram in getStageTimings().items():
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'pdf_pipeline_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'pdf_pipeline_stage_seconds_sum{{stage="{stage}"}} {histogram["sumSeconds"]}')
+        lines.append(f'pdf_pipeline_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+    lines.append("# HELP pdf_pipeline_events_total Pipeline events such as worker recycles and kills.")
+    lines.append("# TYPE pdf_pipeline_events_total counter")
+    for name, count in getCounters().items():
+        lines.append(f'pdf_pipeline_events_total{{event="{name}"}} {count}')
+
+    sample = getResourceSampler().latest
+    for name, key in (("cpu_percent", "cpuPercent"), ("memory_percent", "memoryPercent"),
+                      ("rss_bytes", "rssBytes"), ("peak_rss_bytes", "peakRssBytes"), ("threads", "threads")):
+        lines.append(f"# TYPE pdf_pipeline_{name} gauge")
+        lines.append(f"pdf_pipeline_{name} {sample[key]}")
+    return "\n".join(lines) + "\n"
+
+
+## function to write the metrics of a run as JSON
+def writeMetrics(path=metricsOutputPath):
+    if not path:
+        return
+    try:
+        with open(path, 'w') as f:
+            json.dump(exportMetricsJson(), f, indent=2)
+        logging.info(f"Metrics written to {path}.")
+    except Exception as e:
+        logging.error(f"Error writing metrics to {path}: {e}.")
+
+
+## request handler serving /metrics and /metrics.json
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, contentType = exportPrometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, contentType = json.dumps(exportMetricsJson()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass ## scrapes are not worth a log line
+
+
+## function to serve metrics over http in a background thread
+def startMetricsServer(port=metricsPort):
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Serving metrics on http://0.0.0.0:{port}/metrics")
+    return server
@@ -0,0 +1,150 @@
+import re
+import hashlib
+import datetime
+import threading
+import logging
+import numpy as np
+from pymongo import ASCENDING, errors
+from database import getCollection, getLshCollection
+from config import nearDuplicateThreshold, minhashPermutations, lshBands, shingleSize ## importing from config.py
+
+## near duplicate detection: a minhash signature over the word shingles of a document's text, indexed by lsh bands
+## in mongodb, so only documents sharing a band with it are compared instead of every processed document.
+## lsh record: {"source": filePath or url, "contentHash", "signature": [minhashPermutations ints], "bands": ["<band>:<hash>", ...], "indexedAt"}
+## with 16 bands of 8 rows a document at jaccard 0.9 shares a band with probability above 0.999, one at 0.5 with about 0.06.
+## documents in flight at the same time are not compared with each other, only with documents already indexed.
+
+wordPattern = re.compile(r"\w+")
+chunkSize = 4096 ## shingles permuted at once, bounds memory on long documents
+
+## permutations shared by every signature, with a fixed seed so signatures of other runs and nodes compare
+permutationRng = np.random.RandomState(1)
+permutationA = permutationRng.randint(0, 1 << 63, size=minhashPermutations, dtype=np.uint64)*np.uint64(2)+np.uint64(1) ## odd multipliers
+permutationB = permutationRng.randint(0, 1 << 63, size=minhashPermutations, dtype=np.uint64)
+emptySignatureValue = (1 << 32)-1 ## above every minhash value, signature of a text without words
+
+lshIndexesEnsured = False
+lshIndexesLock = threading.Lock()
+
+
+## function to hash one shingle to 64 bits
+def hashShingle(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+## function to hash the word shingles of a text, a set so repeated passages count once
+def shingleHashes(text, size=shingleSize):
+    words = wordPattern.findall(text.lower())
+    if len(words) <= size:
+        return {hashShingle(" ".join(words))} if words else set()
+    return {hashShingle(" ".join(words[i:i+size])) for i in range(len(words)-size+1)}
+
+
+## function to compute the minhash signature of a text
+def minhashSignature(text, size=shingleSize):
+    """
+    every permutation is a multiply shift hash of the 64 bit shingle hashes, the high 32 bits of (a*x+b) mod 2^64.
+    returns a uint64 array of minhashPermutations values, the fraction of equal values of two signatures
+    estimates the jaccard similarity of their shingle sets.
+    """
+    signature = np.full(minhashPermutations, emptySignatureValue, dtype=np.uint64)
+    hashes = shingleHashes(text, size)
+    if not hashes:
+        return signature
+    values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    for start in range(0, len(values), chunkSize):
+        permuted = (values[start:start+chunkSize, None]*permutationA+permutationB) >> np.uint64(32) ## wraps mod 2^64
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature
+
+
+## function to estimate the jaccard similarity of two signatures
+def estimateSimilarity(signature, other):
+    return float(np.mean(signature == other))
+
+
+## function to turn a signature into its lsh band keys, documents sharing a key are candidates
+def bandKeys(signature, bands=lshBands):
+    rows = len(signature)//bands
+    return [f"{band}:{hashlib.blake2b(signature[band*rows:(band+1)*rows].astype('<u8').tobytes(), digest_size=8).hexdigest()}"
+            for band in range(bands)]
+
+
+## function to create the indexes of the lsh collection, once per process
+def ensureLshIndexes(collection=None):
+    global lshIndexesEnsured
+    with lshIndexesLock:
+        if lshIndexesEnsured:
+            return
+        collection = collection if collection is not None else getLshCollection()
+        collection.create_index([("source", ASCENDING)], unique=True) ## a reprocessed source replaces its record
+        collection.create_index([("bands", ASCENDING)]) ## multikey, candidate lookups
+        lshIndexesEnsured = True
+
+
+## function to turn the keywordScores of a matched document back into (term, score) pairs
+def matchScores(match):
+    if match.get("keywordScores"):
+        return [(item["keyword"], item["score"]) for item in match["keywordScores"]]
+    return [(word, 0.0) for word in match.get("keywords") or []] ## processed before scores were stored
+
+
+## function to find an already processed document whose text is nearly the same
+def findNearDuplicate(text, exclude=None, threshold=nearDuplicateThreshold, collection=None, lshCollection=None):
+    """
+    exclude is the document's own source, so a file changed in place is not matched with its earlier version.
+    returns (signature, match), match is None or the original's results:
+    {"nearDuplicateOf", "similarity", "summary", "keywords", "keywordScores", "lengthCategory", "summaryRoute"}
+    nearDuplicateOf is the first document processed, also when the best match is itself a near duplicate.
+    mongodb errors are logged and the document is treated as new.
+    example(how to use):
+    signature, match = findNearDuplicate(text, exclude=filePath)
+    if match is None:
+        ## summarise, persist, then
+        indexDocument(filePath, contentHash, signature)
+    """
+    signature = minhashSignature(text)
+    lshCollection = lshCollection if lshCollection is not None else getLshCollection()
+    collection = collection if collection is not None else getCollection()
+    try:
+        ensureLshIndexes(lshCollection)
+        filterDoc = {"bands": {"$in": bandKeys(signature)}}
+        if exclude:
+            filterDoc["source"] = {"$ne": exclude}
+
+        best, bestSimilarity = None, threshold
+        for record in lshCollection.find(filterDoc, {"_id": 0, "source": 1, "signature": 1}):
+            similarity = estimateSimilarity(signature, np.array(record["signature"], dtype=np.uint64))
+            if similarity >= bestSimilarity:
+                best, bestSimilarity = record["source"], similarity
+        if best is None:
+            return signature, None
+
+        original = collection.find_one(
+            {"$or": [{"filePath": best}, {"url": best}], "summary": {"$nin": [None, ""]}}, ## only documents that finished with a summary
+            {"_id": 0, "summary": 1, "keywords": 1, "keywordScores": 1, "lengthCategory": 1, "summaryRoute": 1, "nearDuplicateOf": 1}
+        )
+    except errors.PyMongoError as e:
+        logging.error(f"Near duplicate lookup failed: {e}")
+        return signature, None
+    if not original or not original.get("summary"):
+        return signature, None ## indexed but removed or failed since
+
+    original["nearDuplicateOf"] = original.get("nearDuplicateOf") or best
+    original["similarity"] = round(bestSimilarity, 4)
+    return signature, original
+
+
+## function to add a processed document to the lsh index
+def indexDocument(source, contentHash, signature, lshCollection=None):
+    lshCollection = lshCollection if lshCollection is not None else getLshCollection()
+    try:
+        ensureLshIndexes(lshCollection)
+        lshCollection.update_one(
+            {"source": source},
+            {"$set": {"contentHash": contentHash, "signature": signature.tolist(), "bands": bandKeys(signature),
+                      "indexedAt": datetime.datetime.now()}},
+            upsert=True
+        )
+    except errors.PyMongoError as e:
+        logging.error(f"Failed to index {source} for near duplicate detection: {e}")
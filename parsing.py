@@ -1,134 +1,42 @@
 import os
-import fitz ## PyMuPDF
-import pytesseract 
-from pdfminer.high_level import extract_text ## ecract_text from pdfminer
-from pymongo import MongoClient ## mongooclient 
-from config import mongoUri, databaseName, collectionName, partitionSizes, pdfFolderPath ## importing from config.py
-import requests
+from config import jobOrder, asyncIngestion, resultLogPath, nearDuplicateEnabled ## importing from config.py
 import json
-import re
-from io import BytesIO
-from summarisation import summariseText
-from keywords import extractKeywords
+from extraction import hashFile, extractTextFromPdf, downloadPdfFromUrl, extractTextFromUrl, partitionText
+from database import getCollection
+from summarisation import summariseWithPolicy
+import summarisation
+import database
+from keywords import extractKeywords, getKeywordModel, keywordScoreDocs
 import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from metrics import trackExecutionTime, logResourceUsage, getActiveThreadCount
-from docUpdation import updateProcessedDocument, storeInitialMetadata
+import time
+from metrics import trackExecutionTime, logResourceUsage, getActiveThreadCount, stageTimer, writeMetrics
+from docUpdation import updateProcessedDocument, storeInitialMetadata, storeCachedResult, nearDuplicateFields
+from cache import resultCache
+from engine import PipelineEngine
+from scheduler import runScheduled, iterPdfFiles, AdmissionController
+from asyncIngestion import createUrlIngester
+from manifest import iterManifest, classifyEntry, ResultLog
+from textStore import encodeText
+from nearDuplicates import findNearDuplicate, indexDocument, matchScores
 import logging
 
-## mongoClient setup
-client = MongoClient(mongoUri) 
-db = client[databaseName]
-collection = db[collectionName]
-
 ## setting up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s) - %(levelname)s - %(message)s')
 
 
-## function to extract text using OCR for scanned files
-def extractTextWithOcr(filePath):
-    logging.info(f"Starting OCR extraction for file path: {filePath}.") ## log the start
-    text = "" ## variable to add tect
-    
-    try:
-        pdf = fitz.open(filePath) ## opeing with PyMuPDF
-        for page in pdf:
-            text += pytesseract.image_to_string(page.get_pixmap()) ## using the pytesseract module
-        logging.info(f"OCR extraction completed for {filePath}.") ## log the success
-    except Exception as e:
-        logging.error(f"Error extracting with OCR for {filePath}: {e}.") ## log the failure
-    return text
-
-
-## function to extract text from local pdf file
-def extractTextFromPdf(filePath):
-    logging.info(f"Starting extraction for file path: {filePath}.") ## log the start
-    
-    try:
-        text = extract_text(filePath) ## extracting text from provided file path
-        logging.info(f"Extraction completed for {filePath}.")
-
-        if not text.strip(): ## stripping text
-            logging.info(f"No text found, attempting OCR for {filePath}")
-            text = extractTextWithOcr(filePath) ## calling the extractTextWithOcr function
-        
-        return text  ## returning text
-    
-    except Exception as e:
-        logging.error(f"Error extracting text for {filePath}: {e}")
-        return ""
-
-
-## function to download pdf from url and save it locally
-def downloadPdfFromUrl(url):
-    logging.info(f"Starting to download PDF from URL: {url}")
-    
-    try: 
-        response = requests.get(url) ## reuest from provided url
-        response.raise_for_status() ## check for errors
-
-        ## clean the filename from url
-        fileName = re.sub(r'[^A-Za-z0-9]','_', url.split("/")[-1]) ## checking and removing unwanted characters which cant be used in filename
-        filePath = os.path.join(os.getcwd(), fileName) ## joining current working directory and filename
-
-        with open(filePath, 'wb') as f: ## opeing file path
-            f.write(response.content) ## writing content to file path
-
-        logging.info(f"Downloaded pdf: {filePath}") ## log successful download
-        return filePath
-    
-    except Exception as e:
-        logging.error(f"Error downloadig pdf from {url}: {e} ") ## log any errors
-        return None
-
-
-## function to extract text from pdf given its url(download pdf)
-def extractTextFromUrl(url):
-    logging.info(f"Starting to extract text from URL stream: {url}")
-    try:
-        response = requests.get(url)
-        response.raise_for_status() ## check for http errors
-
-        ## open pdf using BytesIO
-        pdfData = BytesIO(response.content)
-
-        ## open pdf from BytesIO object
-        pdfDocument = fitz.open(stream=pdfData, filetype="pdf")
-        
-        ## extract text from document
-        text = ""
-        for pageNum in range(pdfDocument.page_count):
-            page = pdfDocument.load_page(pageNum)
-            text += page.get_text()
-        
-        if not text.strip():
-            logging.warning(f"No text extracted from URL: {url}") ## log failure
+## function to load the model, open the database connection and load the keyword model up front
+def warmUp():
+    """
+    models and clients are created lazily on first use, long running workers call this
+    once at startup so the first document does not pay for loading them.
+    """
+    startTime = time.perf_counter()
+    summarisation.warmUp()
+    database.warmUp()
+    getKeywordModel()
+    logging.info(f"Pipeline warmed up in {time.perf_counter()-startTime:.2f} seconds.")
 
-        logging.info(f"Successfully extracted text from URL:{url}") ## log success
-        return text
 
-    except Exception as e:
-        logging.error(f"Error extracting text from URL {url}:{e}") ## log error
-        return ""
-    
-
-## function to partition text into categories
-def partitionText(text):
-    logging.info(f"Starting partitioning text into categories.")
-    pages = text.split("\n\n") ## splitting text to new lines
-
-    ## partitioning pasges based on partitionSizes(config.py)
-    if len(pages) <= partitionSizes["short"]:
-        lengthCategory = "short"
-    elif len(pages) <= partitionSizes["medium"]:
-        lengthCategory = "medium"
-    else:
-        lengthCategory = "long"
-    logging.info(f"Succesfully partitioned as {lengthCategory} with {len(pages)} pages.") 
-    
-    return lengthCategory, pages
-    
-    
 ## function to process a single pdf file
 @trackExecutionTime ## track execution time
 def processPdf(filePath):
@@ -143,24 +51,60 @@ def processPdf(filePath):
         size = os.path.getsize(filePath) ## get the file size
         logging.info(f"File size of {filePath}: {size} bytes.")
 
-        storeInitialMetadata(filePath, size) ## store initial metadata in mongodb
-        logging.info(f"Stored initial metadata for {filePath} in MongoDB.")
-
-        text = extractTextFromPdf(filePath) ## calling tha above created function
-        if text:
-            lengthCategory, pages = partitionText(text)
-            summary = summariseText(text) ## calling summariseText from summarisation.py
-            keywords = extractKeywords(text) ## calling extractKeywords from keywords.py
-
-            ## calculate processing time
-            start_time = datetime.datetime.now()
-
-            ## update mongodb with processed information
-            updateProcessedDocument(filePath, summary, keywords, (datetime.datetime.now()-start_time))     
+        ## same content already processed (unchanged file or a copy under another path)
+        with stageTimer("hash"):
+            contentHash = hashFile(filePath)
+            cached = resultCache.get(contentHash) if resultCache else None
 
-            logging.info(f"Processed {filePath} categorised as {lengthCategory}") ## log success
+        if cached:
+            with stageTimer("db"):
+                storeCachedResult(filePath, size, contentHash, cached) ## only record the path mapping
+            logging.info(f"Reused cached result for {filePath} categorised as {cached.get('lengthCategory')}")
         else:
-            logging.warning(f"Failed to process file path") ## log failure
+            with stageTimer("db"):
+                storeInitialMetadata(filePath, size, contentHash) ## store initial metadata in mongodb
+            logging.info(f"Stored initial metadata for {filePath} in MongoDB.")
+
+            with stageTimer("extract"):
+                text = extractTextFromPdf(filePath) ## calling tha above created function
+            if text:
+                lengthCategory, pages = partitionText(text)
+                signature, match = None, None
+                if nearDuplicateEnabled:
+                    with stageTimer("dedup"):
+                        signature, match = findNearDuplicate(text, exclude=filePath) ## minhash lookup in the lsh index
+                if match:
+                    ## near duplicate of a processed document, reuse its results instead of running the model
+                    logging.info(f"{filePath} is a near duplicate of {match['nearDuplicateOf']}, reusing its results.")
+                    summary, summaryRoute = match.get("summary"), match.get("summaryRoute")
+                    scores = matchScores(match)
+                else:
+                    with stageTimer("summarise"):
+                        ## short documents get an extractive summary, the rest go to the model
+                        summary, summaryRoute = summariseWithPolicy(text, lengthCategory, getKeywordModel())
+                    with stageTimer("keywords"):
+                        scores = extractKeywords(text, vectorizer=getKeywordModel(), withScores=True) ## calling extractKeywords from keywords.py
+                keywords = [word for word, score in scores]
+                keywordScores = keywordScoreDocs(scores) ## stored for search ranking (search.py)
+                if not summary:
+                    raise ValueError("empty summary") ## not persisted, so the next run redoes it
+
+                ## calculate processing time
+                start_time = datetime.datetime.now()
+
+                ## update mongodb with processed information
+                with stageTimer("db"):
+                    updateProcessedDocument(filePath, summary, keywords, (datetime.datetime.now()-start_time), contentHash, lengthCategory,
+                                            summaryRoute=summaryRoute, keywordScores=keywordScores, nearDuplicate=match)
+                    if signature is not None and not match:
+                        indexDocument(filePath, contentHash, signature) ## later near duplicates reuse this document's results
+                if resultCache:
+                    resultCache.put(contentHash, {"summary": summary, "keywords": keywords, "keywordScores": keywordScores,
+                                                  "lengthCategory": lengthCategory, "summaryRoute": summaryRoute})
+
+                logging.info(f"Processed {filePath} categorised as {lengthCategory}") ## log success
+            else:
+                logging.warning(f"Failed to process file path") ## log failure
     
     except Exception as e:
         logging.error(f"Error processing PDF from {filePath}.") ## log error
@@ -193,7 +137,7 @@ def processUrl(url, download=False):
             pdfPath = downloadPdfFromUrl(url) ## calling above built function to download text from pdf
             if pdfPath:
                 logging.info(f"Downloaded PDF from {pdfPath}.")
-                text = extractTextFromPdf(fitz.open(pdfPath)) ## opening pdf using PyMuPDF
+                text = extractTextFromPdf(pdfPath) ## extracting from the downloaded file
         else:
             text = extractTextFromUrl(url) ## using above created function to extract text from provided url
     
@@ -203,9 +147,17 @@ def processUrl(url, download=False):
             lengthCategory, pages = partitionText(text) ## calling the partition text function
             logging.info(f"Text categorized as {lengthCategory}")
 
-            ## summarise and extract keywords
-            summary = summariseText(text) ## calling the summarise text function 
-            keywords = extractKeywords(text) ## calling the extractKeywords function from keyword.py 
+            ## near duplicates of a processed document reuse its results
+            signature, match = findNearDuplicate(text, exclude=url) if nearDuplicateEnabled else (None, None)
+            if match:
+                logging.info(f"{url} is a near duplicate of {match['nearDuplicateOf']}, reusing its results.")
+                summary, summaryRoute = match.get("summary"), match.get("summaryRoute")
+                scores = matchScores(match)
+            else:
+                ## summarise and extract keywords
+                summary, summaryRoute = summariseWithPolicy(text, lengthCategory, getKeywordModel()) ## extractive or model summary
+                scores = extractKeywords(text, vectorizer=getKeywordModel(), withScores=True) ## calling the extractKeywords function from keyword.py 
+            keywords = [word for word, score in scores]
         
             ## calculate processing time
             processingTime = (datetime.datetime.now()-startTime).total_seconds()
@@ -214,14 +166,20 @@ def processUrl(url, download=False):
             document = {
                 "url": url,
                 "lengthCategory": lengthCategory,
-                "text": text,
+                "summaryRoute": summaryRoute,
+                "text": encodeText(text, url), ## compressed, inline or in GridFS
                 "summary": summary,
                 "keywords": keywords,
+                "keywordScores": keywordScoreDocs(scores),
                 "processedAt": str(datetime.datetime.now()),
                 "processingTime": processingTime,
             }
+            if match:
+                document.update(nearDuplicateFields(match))
             ## update mongo db
-            collection.insert_one(document)
+            getCollection().insert_one(document)
+            if signature is not None and not match:
+                indexDocument(url, None, signature)
             logging.info(f"Successfully processed and saved data from URL:{url}, categorized as {lengthCategory}")
         
         else:
@@ -237,7 +195,7 @@ def processUrl(url, download=False):
 
 ## function to process json files that may contain file path or url
 @trackExecutionTime ## time taken to execute the function
-def processJson(filePath):
+def processJson(filePath, order=jobOrder):
     logging.info(f"Starting PDF processing from JSON: {filePath}")
     logResourceUsage() ## log resorce usage at start
 
@@ -249,40 +207,52 @@ def processJson(filePath):
     successCount = 0 ## count varisable for success
     failureCount = 0 ## count variable for failure
 
+    ## per entry results are appended to a JSON lines log as they finish, instead of kept until the end
+    resultLog = ResultLog(resultLogPath) if resultLogPath else None
     try:
-        with open(filePath,'r') as jsonFile:
-            data = json.load(jsonFile) ## load json data
-            logging.info(f"Succesfully loaded JSON: {json} file")
-            
-            with ThreadPoolExecutor() as executor:
-                futures = []
-
-                for key, item in data.items(): ## iterate over dict key : value pairs
-                    logging.info(f"Processing items: {key} -> {item}") 
-
-                    ## determine if item is key or file path
-                    if isinstance(item, str) and item.lower().startswith('http'):
-                        futures.append(executor.submit(processUrl, item))
-                        logging.info(f"Scheduled URL for processing: {item}")
-
-                    elif isinstance(item, str) and os.path.isfile(item):
-                        futures.append(executor.submit(processPdf, item))
-                        logging.info(f"Scheduled PDF file for processing: {item}")
-
-                    else:
-                        logging.warning(f"Invalid entry in json {key} -> {item}")
-                        failureCount += 1
-
-                ## collect reults and any exceptions raised
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                        successCount += 1
-                        logging.info(f"Item processed successfully.")
-
-                    except Exception as e:
-                        logging.error(f"Error processing item :{e}")
-                        failureCount += 1
+        ## manifest entries are read one at a time (manifest.py), a .jsonl file or the {"key": item} format
+        entries = iterManifest(filePath)
+        logging.info(f"Streaming JSON manifest: {filePath}")
+
+        ## lazily turn manifest entries into jobs, invalid entries are counted as failures
+        def jobs():
+            nonlocal failureCount
+            for key, item in entries: ## iterate over key : value pairs
+                logging.info(f"Processing items: {key} -> {item}") 
+
+                ## determine if item is key or file path
+                kind = classifyEntry(item)
+                if kind == "url":
+                    logging.info(f"Scheduled URL for processing: {item}")
+                    yield "url", item
+
+                elif kind == "pdf":
+                    logging.info(f"Scheduled PDF file for processing: {item}")
+                    yield "pdf", item
+
+                else:
+                    logging.warning(f"Invalid entry in json {key} -> {item}")
+                    failureCount += 1
+                    if resultLog:
+                        resultLog.write(item, "invalid")
+
+        def onResult(source, error):
+            if resultLog:
+                resultLog.write(source, "success" if error is None else "failure", error)
+
+        ## stage separated engine, extraction in processes and summarisation on its own worker
+        ## entries are admitted only as capacity frees up (scheduler.py)
+        with PipelineEngine() as engine:
+            controller = AdmissionController()
+            ## urls are downloaded concurrently on an event loop and handed to the engine as they arrive
+            urlIngester = createUrlIngester(engine, controller) if asyncIngestion else None
+            try:
+                succeeded, failed = runScheduled(engine, jobs(), controller, order, urlIngester, onResult)
+            finally:
+                if urlIngester:
+                    urlIngester.close()
+            successCount += succeeded
+            failureCount += failed
                         
     except FileNotFoundError:
         logging.error(f"Json file not found: {FileNotFoundError}")
@@ -290,6 +260,9 @@ def processJson(filePath):
         logging.error(f"Error decoding JSON file: {je}")
     except Exception as e:
         logging.error(f"Unexpected error processing json file {filePath} : {e}")
+    finally:
+        if resultLog:
+            resultLog.close()
 
     ## print final success and failure
     logging.info(f"\nProcessing complete. Successfully processed {successCount} items.")
@@ -298,10 +271,11 @@ def processJson(filePath):
     ## log active thread count after processing
     activeThreadCountEnd = getActiveThreadCount()
     logging.info(f"Active thread count after processing {json}: {activeThreadCountEnd}")
+    writeMetrics() ## per stage histograms of the run, when metricsOutputPath is set
 
 
 ## function to process all pdfs in folder concurrently
-def processPdfsConcurrently(folderPath):
+def processPdfsConcurrently(folderPath, order=jobOrder):
     logging.info(f"Starting to process all PDFs in {folderPath}")
     logResourceUsage()  # logging resource at the start
 
@@ -309,23 +283,14 @@ def processPdfsConcurrently(folderPath):
     activeThreadCountStart = getActiveThreadCount()
     logging.info(f"Active thread count before processing {folderPath}: {activeThreadCountStart}")
 
-    # list all files in folder
-    pdfFiles = [os.path.join(folderPath, file) for file in os.listdir(folderPath) if file.lower().endswith(".pdf")]
-    logging.info(f"Found {len(pdfFiles)} PDF(s) to process.")
-
-    # use ThreadPoolExecutor for concurrent processing
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(processPdf, filePath): filePath for filePath in pdfFiles}
-
-        # wait for futures to complete and check for errors
-        for future in as_completed(futures):
-            filePath = futures[future]  # get the file path associated with this future
-            try:
-                future.result()
-                logging.info(f"Successfully processed PDF: {filePath}")
-            except Exception as e:
-                logging.error(f"Error processing PDF from {filePath}: {e}")
+    # use the pipelined engine so extraction, summarisation, keywords and db writes run on separate workers
+    # files are listed lazily and admitted only as capacity frees up (scheduler.py)
+    with PipelineEngine() as engine:
+        pdfJobs = (("pdf", filePath) for filePath in iterPdfFiles(folderPath))
+        successCount, failureCount = runScheduled(engine, pdfJobs, order=order) # fifo, longest or shortest first
+    logging.info(f"Processed {successCount} PDF(s), {failureCount} failed.")
 
     # log active thread count after processing
     activeThreadCountEnd = getActiveThreadCount()
     logging.info(f"Active thread count after processing {folderPath}: {activeThreadCountEnd}")
+    writeMetrics() # per stage histograms of the run, when metricsOutputPath is set
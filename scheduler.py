@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import threading
+import logging
+import psutil
+import fitz ## PyMuPDF
+from config import maxInFlight, inFlightByteBudget, largeFileBytes, maxLargeInFlight, rssBudget ## importing from config.py
+from config import jobOrder, costWeights, costReportPath
+
+
+## class admitting new work only as capacity frees up
+class AdmissionController:
+    """
+    bounds the documents in flight by count, by total file size and by rss.
+    large documents (>= largeFileBytes) have their own smaller limit so a few big files
+    can not take the whole budget from the small ones.
+    a document is always admitted when nothing else is in flight, so a file larger than the budget still runs.
+    example(how to use):
+    controller = AdmissionController()
+    controller.acquire(size) ## blocks until there is room
+    future = engine.submitPdf(filePath)
+    future.add_done_callback(lambda f: controller.release(size))
+    """
+    def __init__(self, maxInFlight=maxInFlight, byteBudget=inFlightByteBudget, largeFileBytes=largeFileBytes,
+                 maxLargeInFlight=maxLargeInFlight, rssBudget=rssBudget):
+        self.maxInFlight = maxInFlight
+        self.byteBudget = byteBudget
+        self.largeFileBytes = largeFileBytes
+        self.maxLargeInFlight = maxLargeInFlight
+        self.rssBudget = rssBudget
+        self.process = psutil.Process()
+        self.condition = threading.Condition()
+        self.inFlight = 0
+        self.inFlightBytes = 0
+        self.largeInFlight = 0
+
+    ## rss of this process and its pool workers
+    def currentRss(self):
+        rss = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass ## worker exited
+        return rss
+
+    ## check if a document of size bytes fits, called with the condition held
+    def hasRoom(self, size):
+        if self.inFlight == 0:
+            return True
+        if self.inFlight >= self.maxInFlight:
+            return False
+        if self.inFlightBytes + size > self.byteBudget:
+            return False
+        if size >= self.largeFileBytes and self.largeInFlight >= self.maxLargeInFlight:
+            return False
+        if self.rssBudget and self.currentRss() > self.rssBudget:
+            return False
+        return True
+
+    ## block until a document of size bytes can be admitted
+    def acquire(self, size):
+        with self.condition:
+            while not self.hasRoom(size):
+                ## rss changes without a release, so re-check every half second
+                self.condition.wait(0.5 if self.rssBudget else None)
+            self.inFlight += 1
+            self.inFlightBytes += size
+            if size >= self.largeFileBytes:
+                self.largeInFlight += 1
+
+    ## free the capacity of a finished document
+    def release(self, size):
+        with self.condition:
+            self.inFlight -= 1
+            self.inFlightBytes -= size
+            if size >= self.largeFileBytes:
+                self.largeInFlight -= 1
+            self.condition.notify_all()
+
+
+## function to lazily list the pdfs of a folder, without building the whole list
+def iterPdfFiles(folderPath):
+    with os.scandir(folderPath) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".pdf"):
+                yield entry.path
+
+
+## function to estimate the processing cost of a local pdf up front
+def estimateCost(filePath, samplePages=3):
+    """
+    returns {"size", "pages", "hasTextLayer", "estimatedSeconds"}.
+    the page count comes from the pdf metadata and only the first samplePages pages are checked
+    for a text layer, so estimating is cheap compared to processing.
+    """
+    size = os.path.getsize(filePath)
+    try:
+        with fitz.open(filePath) as pdf:
+            pages = pdf.page_count
+            hasTextLayer = any(pdf.load_page(i).get_text().strip() for i in range(min(samplePages, pages)))
+    except Exception as e:
+        logging.warning(f"Could not open {filePath} to estimate its cost: {e}")
+        pages, hasTextLayer = 1, True
+
+    pageCost = costWeights["textPage"] if hasTextLayer else costWeights["scannedPage"] ## scanned pages need OCR
+    estimatedSeconds = pages*pageCost + size/1024/1024*costWeights["megabyte"]
+    return {"size": size, "pages": pages, "hasTextLayer": hasTextLayer, "estimatedSeconds": estimatedSeconds}
+
+
+## function to order jobs by estimated cost
+def orderJobs(jobs, order=jobOrder, estimates=None):
+    """
+    "fifo" keeps the input order and stays lazy.
+    "longest" runs the most expensive documents first, so one large pdf does not start last and
+    dominate the makespan. "shortest" runs the cheapest first for fast first results.
+    ordering needs every estimate up front, so the jobs are read into a list.
+    urls have no cost until downloaded and keep their order after the local files.
+    files that can not be read are kept at the end, so runScheduled counts and reports them as failures.
+    estimates (a dict) is filled with source -> estimate for the cost report.
+    """
+    if order == "fifo":
+        return jobs
+    if order not in ("longest", "shortest"):
+        raise ValueError(f"Unknown job order: {order}")
+
+    pdfJobs = []
+    urlJobs = []
+    unreadableJobs = []
+    for kind, source in jobs:
+        if kind != "pdf":
+            urlJobs.append((kind, source))
+            continue
+        try:
+            estimate = estimateCost(source)
+        except OSError as e:
+            logging.error(f"Error reading {source}: {e}")
+            unreadableJobs.append((kind, source))
+            continue
+        if estimates is not None:
+            estimates[source] = estimate
+        pdfJobs.append((estimate["estimatedSeconds"], kind, source))
+
+    pdfJobs.sort(key=lambda job: job[0], reverse=(order == "longest"))
+    logging.info(f"Ordered {len(pdfJobs)} PDF(s) {order} first by estimated cost.")
+    return [(kind, source) for cost, kind, source in pdfJobs] + urlJobs + unreadableJobs
+
+
+## function to log and optionally save estimated against actual cost
+def reportCosts(estimates, actuals, path=costReportPath):
+    rows = [{"source": source, **estimates[source], "actualSeconds": actuals[source]} for source in estimates if source in actuals]
+    if not rows:
+        return
+    ratios = [row["actualSeconds"]/row["estimatedSeconds"] for row in rows if row["estimatedSeconds"] > 0]
+    meanRatio = sum(ratios)/len(ratios) if ratios else None
+    logging.info(f"Cost model: {len(rows)} documents, mean actual/estimated ratio {meanRatio}.")
+
+    if path:
+        try:
+            with open(path, 'w') as f:
+                json.dump({"meanRatio": meanRatio, "weights": costWeights, "documents": rows}, f, indent=2)
+            logging.info(f"Cost report written to {path}.")
+        except Exception as e:
+            logging.error(f"Error writing cost report to {path}: {e}.")
+
+
+## function to feed jobs to the engine through an admission controller
+def runScheduled(engine, jobs, controller=None, order=jobOrder, urlIngester=None, onResult=None):
+    """
+    jobs is any iterable of ("pdf", filePath) or ("url", url), consumed lazily with the "fifo" order.
+    order is "fifo", "longest" or "shortest" (see orderJobs).
+    with a urlIngester (asyncIngestion.py) urls are downloaded on its event loop and it admits them
+    through the same controller once their size is known.
+    onResult(source, error) is called as each job finishes, error is None on success.
+    returns (successCount, failureCount) once every admitted job has finished.
+    no future is kept per job, so memory does not grow with the number of jobs.
+    """
+    controller = controller or AdmissionController()
+    counts = {"success": 0, "failure": 0, "pending": 0}
+    countsCondition = threading.Condition()
+    estimates = {}
+    actuals = {} ## source -> seconds from submit until persisted, only for estimated jobs
+    jobs = orderJobs(jobs, order, estimates)
+
+    def onDone(source, size, startTime, future):
+        if size is not None:
+            controller.release(size)
+        if source in estimates:
+            actuals[source] = time.perf_counter()-startTime
+        error = None
+        try:
+            future.result()
+            logging.info(f"Successfully processed: {source}")
+            outcome = "success"
+        except Exception as e:
+            logging.error(f"Error processing {source}: {e}")
+            outcome = "failure"
+            error = e
+        if onResult:
+            onResult(source, error)
+        with countsCondition:
+            counts[outcome] += 1
+            counts["pending"] -= 1
+            countsCondition.notify_all()
+
+    ## job that failed before it reached the engine
+    def onFailed(source, error):
+        with countsCondition:
+            counts["failure"] += 1
+        if onResult:
+            onResult(source, error)
+
+    for kind, source in jobs:
+        if kind == "url" and urlIngester is not None:
+            try:
+                future = urlIngester.submit(source) ## blocks only while too many downloads are running
+            except Exception as e:
+                logging.error(f"Error submitting {source}: {e}")
+                onFailed(source, e)
+                continue
+            with countsCondition:
+                counts["pending"] += 1
+            future.add_done_callback(lambda f, source=source: onDone(source, None, None, f))
+            continue
+
+        try:
+            if source in estimates:
+                size = estimates[source]["size"]
+            else:
+                size = os.path.getsize(source) if kind == "pdf" else 0 ## url sizes are unknown until downloaded
+            controller.acquire(size) ## backpressure, waits for running documents to finish
+        except OSError as e:
+            logging.error(f"Error reading {source}: {e}")
+            onFailed(source, e)
+            continue
+
+        try:
+            startTime = time.perf_counter()
+            future = engine.submitPdf(source) if kind == "pdf" else engine.submitUrl(source)
+        except Exception as e:
+            controller.release(size)
+            logging.error(f"Error submitting {source}: {e}")
+            onFailed(source, e)
+            continue
+
+        with countsCondition:
+            counts["pending"] += 1
+        future.add_done_callback(lambda f, source=source, size=size, startTime=startTime: onDone(source, size, startTime, f))
+
+    ## wait for every admitted job to finish
+    with countsCondition:
+        while counts["pending"] > 0:
+            countsCondition.wait()
+
+    reportCosts(estimates, actuals)
+    return counts["success"], counts["failure"]
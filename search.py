@@ -0,0 +1,58 @@
+import sys
+import json
+import logging
+from database import getCollection
+
+## keyword search over processed documents, ranked by the tfidf scores stored with their keywords
+## usage: python search.py revenue budget [--limit 10]
+
+
+## function to normalise search terms like the keyword vectorizer does
+def normaliseTerms(terms):
+    return sorted({term.strip().lower() for term in terms if term and term.strip()})
+
+
+## function to find documents by keywords, best matches first
+def searchKeywords(terms, limit=10, collection=None):
+    """
+    a document matches when any of its keywords is one of the terms (served by the multikey keywords index),
+    its score is the sum of the stored keywordScores of the matched terms.
+    documents processed before scores were stored score 0 and come last.
+    returns documents without their text, each with a "score" field.
+    example(how to use):
+    for document in searchKeywords(["revenue", "budget"]):
+        print(document.get("filePath") or document.get("url"), document["score"])
+    """
+    terms = normaliseTerms(terms)
+    if not terms:
+        return []
+    collection = collection if collection is not None else getCollection()
+    pipeline = [
+        {"$match": {"keywords": {"$in": terms}}},
+        {"$project": {"text": 0, "journal": 0}},
+        {"$addFields": {"score": {"$sum": {"$map": {
+            "input": {"$filter": {"input": {"$ifNull": ["$keywordScores", []]},
+                                  "as": "item", "cond": {"$in": ["$$item.keyword", terms]}}},
+            "as": "item", "in": "$$item.score"}}}}},
+        {"$sort": {"score": -1, "processedAt": -1}},
+        {"$limit": limit},
+    ]
+    results = list(collection.aggregate(pipeline))
+    logging.info(f"Keyword search for {terms} returned {len(results)} documents.")
+    return results
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    limit = 10
+    if "--limit" in args:
+        index = args.index("--limit")
+        limit = int(args[index+1])
+        del args[index:index+2]
+
+    for document in searchKeywords(args, limit):
+        print(json.dumps({
+            "source": document.get("filePath") or document.get("url"),
+            "score": round(document["score"], 4),
+            "summary": document.get("summary"),
+        }))
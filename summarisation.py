@@ -1,6 +1,316 @@
-from transformers import pipeline
+from config import summaryBatchSize, summaryMaxWait, chunkedSummarisation, chunkOverlap ## importing from config.py
+from config import summariserModel, summariserBackend, summariserWorkers, intraOpThreads, interOpThreads, onnxModelDir
+from config import extractiveCategories, extractiveMaxWords
+from keywords import extractiveSummary
+from concurrent.futures import Future
+import os
+import threading
+import itertools
+import time
+import logging
+
+## summarisation pipeline of this process, loaded on first use so importing this module stays fast
+summariserPipeline = None
+summariserLock = threading.Lock()
+## the fast tokenizer is not thread safe, calls with different truncation settings raise "Already borrowed"
+tokenizerLock = threading.Lock()
+
+
+## function to tokenize text with the shared tokenizer, returns the token ids
+def tokenize(text, **kwargs):
+    tokenizer = getSummariser().tokenizer
+    with tokenizerLock:
+        return tokenizer(text, **kwargs)["input_ids"]
+
+
+## function to get the (intraOp, interOp) thread counts of the model
+def threadCounts():
+    """
+    the cores are split between the summariser workers, so several workers (or processPdf threads)
+    running the model at once do not oversubscribe the cpu.
+    """
+    intraOp = intraOpThreads or max(1, (os.cpu_count() or 1)//max(1, summariserWorkers))
+    return intraOp, interOpThreads
+
+
+## function to apply the thread counts to torch, once per process
+def configureTorchThreads():
+    import torch
+    intraOp, interOp = threadCounts()
+    torch.set_num_threads(intraOp)
+    try:
+        torch.set_num_interop_threads(interOp)
+    except RuntimeError:
+        pass ## can only be set before torch runs any parallel work, the first setting stays
+    logging.info(f"Torch using {intraOp} intra-op and {interOp} inter-op threads.")
+
+
+## fp32 pytorch model
+def loadPytorchSummariser():
+    from transformers import pipeline ## importing transformers alone takes seconds
+    configureTorchThreads()
+    return pipeline("summarization", model=summariserModel, tokenizer=summariserModel)
+
+
+## pytorch model with the linear layers dynamically quantized to int8, cpu only
+def loadQuantizedSummariser():
+    import torch
+    summariser = loadPytorchSummariser()
+    summariser.model = torch.quantization.quantize_dynamic(summariser.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return summariser
+
+
+## model exported to onnx and run by onnx runtime (pip install optimum[onnxruntime])
+def loadOnnxSummariser():
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import pipeline, AutoTokenizer
+    intraOp, interOp = threadCounts()
+    sessionOptions = onnxruntime.SessionOptions()
+    sessionOptions.intra_op_num_threads = intraOp
+    sessionOptions.inter_op_num_threads = interOp
+
+    if onnxModelDir and os.path.isdir(onnxModelDir):
+        model = ORTModelForSeq2SeqLM.from_pretrained(onnxModelDir, session_options=sessionOptions)
+    else:
+        logging.info(f"Exporting {summariserModel} to ONNX, this runs once when onnxModelDir is set.")
+        model = ORTModelForSeq2SeqLM.from_pretrained(summariserModel, export=True, session_options=sessionOptions)
+        if onnxModelDir:
+            model.save_pretrained(onnxModelDir)
+    return pipeline("summarization", model=model, tokenizer=AutoTokenizer.from_pretrained(summariserModel))
+
+
+## summariser backends by name, selected with summariserBackend in config.py
+summariserBackends = {
+    "pytorch": loadPytorchSummariser,
+    "quantized": loadQuantizedSummariser,
+    "onnx": loadOnnxSummariser,
+}
+
+
+## function to load a summariser backend without making it the shared one
+def loadSummariser(backend=summariserBackend):
+    if backend not in summariserBackends:
+        raise ValueError(f"Unknown summariser backend: {backend}")
+    logging.info(f"Loading summarisation model with the {backend} backend.")
+    return summariserBackends[backend]()
+
+
+## function to replace the shared summariser, e.g. to compare backends in one process
+def useSummariser(newSummariser):
+    global summariserPipeline
+    with summariserLock:
+        summariserPipeline = newSummariser
+
+
+## function returning the shared summarisation pipeline, loading it on first use
+def getSummariser():
+    global summariserPipeline
+    if summariserPipeline is None:
+        with summariserLock:
+            if summariserPipeline is None: ## another thread may have loaded it while we waited
+                summariserPipeline = loadSummariser()
+    return summariserPipeline
+
+
+## keeps "from summarisation import summariser" working, the model is loaded on access
+def __getattr__(name):
+    if name == "summariser":
+        return getSummariser()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+## function to load the model and run it once, for long running workers before the first document
+def warmUp():
+    startTime = time.perf_counter()
+    generateSummaries([tokenize("Warm up the summarisation model.")], 10, 1)
+    logging.info(f"Summarisation model warmed up in {time.perf_counter()-startTime:.2f} seconds.")
+
+
+## function to decide how a document is summarised, returns "extractive" or "abstractive"
+def chooseSummaryRoute(text, lengthCategory):
+    """
+    short documents (extractiveCategories and at most extractiveMaxWords words) take the extractive
+    fast path, everything else goes to the model. the word limit guards against documents with
+    few but dense pages, which partitionText counts as short.
+    """
+    if lengthCategory in extractiveCategories and len(text.split()) <= extractiveMaxWords:
+        return "extractive"
+    return "abstractive"
+
+
+## function to summarise one document with the tiered policy, returns (summary, route)
+def summariseWithPolicy(text, lengthCategory, vectorizer=None):
+    route = chooseSummaryRoute(text, lengthCategory)
+    logging.info(f"Summarising {lengthCategory} document with the {route} route.")
+    if route == "extractive":
+        return extractiveSummary(text, vectorizer=vectorizer), route
+    return summariseText(text), route
+
+
+## function to get (maxSummaryLength, minSummaryLength) for a document length in tokens
+def summaryLengths(documentLength):
+    if documentLength <= 100: ## short document
+        return 50, 20
+    elif documentLength <= 500: ## medium document
+        return 100, 30
+    elif documentLength <= 1000: ## long document
+        return 150, 50
+    else:
+        return 300, 100 ## long summary
+
+
+## lengths of the partial summaries of map reduce, long document lengths so several of them fit in one window
+partialLengths = summaryLengths(1000)
+
+
+## function to split a document into token windows, tokenizing the text only once
+def iterTokenWindows(text, windowSize, overlap=chunkOverlap, segmentLength=20000):
+    """
+    yields lists of token ids (without special tokens) of at most windowSize tokens,
+    neighbouring windows share overlap tokens.
+    the text is tokenized in segments of about segmentLength characters so memory stays bounded
+    no matter how long the document is.
+    """
+    overlap = min(overlap, windowSize-1)
+    buffer = []
+    newTokens = 0 ## tokens in the buffer not yet yielded in a window
+    start = 0
+    while start < len(text):
+        end = min(len(text), start+segmentLength)
+        if end < len(text):
+            space = text.rfind(" ", start, end) ## cut segments on whitespace so words are not split
+            if space > start:
+                end = space
+        tokens = tokenize(text[start:end], add_special_tokens=False)
+        buffer.extend(tokens)
+        newTokens += len(tokens)
+        start = end
+
+        while len(buffer) >= windowSize:
+            yield buffer[:windowSize]
+            buffer = buffer[windowSize-overlap:]
+            newTokens = len(buffer)-overlap
+
+    if newTokens > 0:
+        yield buffer
+
+
+## function to prepare a document for the model
+def prepareDocument(text, maxInputLength):
+    """
+    returns ("single", inputIds) when the document fits in the model input,
+    or ("mapReduce", windows) with an iterator over all token windows when it does not.
+    """
+    summariser = getSummariser()
+    windowSize = maxInputLength - summariser.tokenizer.num_special_tokens_to_add() ## room for <s> and </s>
+    windows = iterTokenWindows(text, windowSize)
+    first = next(windows, [])
+    second = next(windows, None)
+
+    if second is None:
+        return "single", summariser.tokenizer.build_inputs_with_special_tokens(first)
+
+    if not chunkedSummarisation:
+        print(f"input text truncated to {maxInputLength} tokens")
+        return "single", summariser.tokenizer.build_inputs_with_special_tokens(first)
+
+    return "mapReduce", itertools.chain([first, second], windows)
+
+
+## class folding the partial summaries of a document longer than the model input
+class MapReduceState:
+    """
+    map: the token windows are summarised with long document lengths, at most batchSize windows are
+    requested or waiting to be folded at a time.
+    reduce: partial summaries are folded in window order and combined into one as soon as they would no longer
+    fit in the model input, the last reduce gives the final summary. so memory stays bounded on any length.
+    the state does not run the model, it returns requests (lengths, inputIds, key) and takes their summaries
+    back with onResult: mapReduceSummary runs them itself, MicroBatcher puts them in its shared length buckets.
+    """
+    def __init__(self, windows, maxInputLength=1024, batchSize=summaryBatchSize):
+        self.tokenizer = getSummariser().tokenizer
+        self.windowSize = maxInputLength - self.tokenizer.num_special_tokens_to_add()
+        self.maxInputLength = maxInputLength
+        self.batchSize = batchSize
+        self.windows = windows
+        self.windowCount = 0 ## windows taken from the iterator
+        self.exhausted = False
+        self.results = {} ## window index -> partial summary not folded yet
+        self.folded = 0 ## windows folded into partials
+        self.partials = [] ## partial summaries not yet reduced
+        self.partialTokens = 0
+        self.reducing = False ## a reduce of the partials is requested, folding waits for it
+        self.finalRequested = False
+        self.summary = None ## the final summary once its reduce finished
+        self.lock = threading.Lock() ## for MicroBatcher, steps of one document can finish on several workers
+
+    ## request summarising the joined partial summaries with the given lengths
+    def reduceRequest(self, lengths, key):
+        ids = tokenize(" ".join(self.partials), truncation=True, max_length=self.maxInputLength)
+        return lengths, ids, key
+
+    ## fold finished windows and request more windows or the reduce steps, returns the new requests
+    def advance(self):
+        requests = []
+        while not self.reducing and self.folded in self.results:
+            summary = self.results[self.folded]
+            tokens = len(tokenize(summary, add_special_tokens=False))
+            if self.partials and self.partialTokens+tokens > self.windowSize:
+                self.reducing = True
+                requests.append(self.reduceRequest(partialLengths, "reduce"))
+                break
+            del self.results[self.folded]
+            self.folded += 1
+            self.partials.append(summary)
+            self.partialTokens += tokens
+
+        ## map step
+        while not self.exhausted and self.windowCount-self.folded < self.batchSize:
+            window = next(self.windows, None)
+            if window is None:
+                self.exhausted = True
+                break
+            requests.append((partialLengths, self.tokenizer.build_inputs_with_special_tokens(window), self.windowCount))
+            self.windowCount += 1
+
+        ## reduce step, the final summary uses the lengths of a very long document
+        if self.exhausted and self.folded == self.windowCount and not self.reducing and not self.finalRequested:
+            print(f"Summarised {self.windowCount} windows, reducing {len(self.partials)} partial summaries")
+            self.finalRequested = True
+            requests.append(self.reduceRequest(summaryLengths(self.maxInputLength+1), "final"))
+        return requests
+
+    ## take the summary of a request, returns the requests it unblocked
+    def onResult(self, key, summary):
+        if key == "final":
+            self.summary = summary
+            return []
+        if key == "reduce":
+            self.reducing = False
+            self.partials = [summary]
+            self.partialTokens = len(tokenize(summary, add_special_tokens=False))
+        else:
+            self.results[key] = summary
+        return self.advance()
+
+
+## function to summarise a document longer than the model input
+def mapReduceSummary(windows, maxInputLength=1024, batchSize=summaryBatchSize):
+    """
+    runs the requests of a MapReduceState in batches of the same lengths until the final summary is back.
+    """
+    state = MapReduceState(windows, maxInputLength, batchSize)
+    requests = state.advance()
+    while requests:
+        lengths = requests[0][0]
+        batch = [request for request in requests if request[0] == lengths]
+        requests = [request for request in requests if request[0] != lengths]
+        summaries = generateSummaries([ids for lengths, ids, key in batch], *lengths)
+        for request, summary in zip(batch, summaries):
+            requests.extend(state.onResult(request[2], summary))
+    return state.summary
 
-summariser = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6", tokenizer="sshleifer/distilbart-cnn-12-6")
 
 def summariseText(text, maxInputLength=1024):
     ## check if input text is valid(not empty)
@@ -13,47 +323,32 @@ def summariseText(text, maxInputLength=1024):
         print("Error. Max input length must be a positive integer.")
         return ""
 
-    ## tokenize the input to check its length
-    inputTokens = summariser.tokenizer(text, truncation=True, padding='longest', max_length=maxInputLength, return_tensors="pt")
-    
-    ## check number of tokens
-    documentLength = inputTokens.input_ids.shape[1] ## number of tokens in input
+    try:
+        ## tokenize once, long documents are split into windows instead of being truncated
+        mode, inputTokens = prepareDocument(text, maxInputLength)
 
-    ## truncate input tokens if they exceed models max input length
-    if documentLength > maxInputLength:
-        inputTokens = inputTokens.input_ids[0][:maxInputLength]
-        text = summariser.tokenizer.decode(inputTokens, skip_special_tokens=True)
-        print(f"input text truncated to {maxInputLength} tokens")
+        if mode == "mapReduce":
+            print(f"Document longer than {maxInputLength} tokens, using map reduce summarisation")
+            summary = mapReduceSummary(inputTokens, maxInputLength)
+            print(f"Generated summary: {summary}")
+            return summary
 
-    ## adjust summary length for short, medium, long and very long documents
-    if documentLength <= 100: ## short document
-        maxSummaryLength = 50 
-        minSummaryLength = 20 
-    elif documentLength <= 500: ## medium document
-        maxSummaryLength = 100 
-        minSummaryLength = 30 
-    elif documentLength <= 1000: ## long document
-        maxSummaryLength = 150
-        minSummaryLength = 50 
-    else:
-        maxSummaryLength = 300 ## long summary
-        minSummaryLength = 100
-    
-    print(f"Document length: {documentLength}, maxSummaryLength: {maxSummaryLength}, minSummaryLength: {minSummaryLength}")
+        ## check number of tokens
+        documentLength = len(inputTokens) ## number of tokens in input
 
-    try:
-        ## generate summary
-        summary = summariser(text,
-                              max_new_tokens=maxSummaryLength,
-                              min_length=minSummaryLength,
-                              truncation=True,
-                              do_sample=False) ## adjust min length as needed for more control
+        ## adjust summary length for short, medium, long and very long documents
+        maxSummaryLength, minSummaryLength = summaryLengths(documentLength)
+        
+        print(f"Document length: {documentLength}, maxSummaryLength: {maxSummaryLength}, minSummaryLength: {minSummaryLength}")
+
+        ## generate summary from the token ids, the text is not tokenized again
+        summary = generateSummaries([inputTokens], maxSummaryLength, minSummaryLength)
 
         print(f"Generated summary: {summary}")
         
         ## return summary text
         if summary and len(summary) > 0:
-            return summary[0]['summary_text']
+            return summary[0]
         else:
             return ""
     
@@ -68,4 +363,219 @@ def summariseText(text, maxInputLength=1024):
     
     except Exception as e:
         print(f"Error during summarisation: {e}")
-        return ""
\ No newline at end of file
+        return ""
+
+
+## function to run the model on a batch of already tokenized documents
+def generateSummaries(inputIds, maxSummaryLength, minSummaryLength):
+    """
+    pads the token ids to the longest document in the batch and runs one generate call.
+    all documents in a batch should come from the same length bucket (summaryLengths).
+    """
+    summariser = getSummariser()
+    batch = summariser.tokenizer.pad({"input_ids": inputIds}, padding="longest", return_tensors="pt")
+    outputIds = summariser.model.generate(batch["input_ids"].to(summariser.device),
+                                          attention_mask=batch["attention_mask"].to(summariser.device),
+                                          max_new_tokens=maxSummaryLength,
+                                          min_length=minSummaryLength,
+                                          do_sample=False)
+    with tokenizerLock:
+        return summariser.tokenizer.batch_decode(outputIds, skip_special_tokens=True)
+
+
+## function to summarise many documents with batched inference
+def summariseTexts(texts, maxInputLength=1024, batchSize=summaryBatchSize):
+    """
+    returns a list of summaries in the same order as texts.
+    documents are grouped by the length buckets of summaryLengths and padded within each bucket,
+    invalid documents or failed batches get an empty summary like summariseText.
+    """
+    summaries = [""] * len(texts)
+    validIndexes = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+    if not validIndexes:
+        return summaries
+
+    ## tokenize once, without padding, so each document can be bucketed by its own length
+    buckets = {}
+    for index in validIndexes:
+        try:
+            mode, prepared = prepareDocument(texts[index], maxInputLength)
+            if mode == "mapReduce":
+                ## long documents batch their own windows
+                summaries[index] = mapReduceSummary(prepared, maxInputLength, batchSize)
+            else:
+                ## group documents by summary length bucket
+                buckets.setdefault(summaryLengths(len(prepared)), []).append((index, prepared))
+        except Exception as e:
+            logging.error(f"Error during summarisation of document {index}: {e}")
+
+    for (maxSummaryLength, minSummaryLength), items in buckets.items():
+        items.sort(key=lambda item: len(item[1])) ## similar lengths together means less padding
+        for start in range(0, len(items), batchSize):
+            batch = items[start:start+batchSize]
+            try:
+                results = generateSummaries([ids for index, ids in batch], maxSummaryLength, minSummaryLength)
+                for (index, ids), summary in zip(batch, results):
+                    summaries[index] = summary
+            except Exception as e:
+                logging.error(f"Error during batched summarisation of {len(batch)} documents: {e}")
+
+    logging.info(f"Summarised {len(validIndexes)} documents in {len(buckets)} length buckets.")
+    return summaries
+
+
+## class that collects documents from many threads and summarises them in batches
+class MicroBatcher:
+    """
+    micro batcher that the concurrent paths feed one document at a time.
+    pending documents are grouped by length bucket, a bucket is flushed when it holds batchSize
+    documents or when its oldest document has waited maxWait seconds.
+    documents longer than the model input are map reduced through the same buckets (MapReduceState), their
+    windows are batched with other documents instead of holding up the worker for the whole document.
+    documents are tokenized on the worker as well, so submit returns right away and the tokenizer
+    is only used by the model workers (and behind tokenizerLock).
+    example(how to use):
+    batcher = MicroBatcher()
+    future = batcher.submit(text) ## returns a concurrent.futures.Future
+    summary = future.result()
+    batcher.close()
+    """
+    def __init__(self, batchSize=summaryBatchSize, maxWait=summaryMaxWait, maxInputLength=1024, workers=1):
+        self.batchSize = batchSize
+        self.maxWait = maxWait
+        self.maxInputLength = maxInputLength
+        self.pending = {} ## bucket -> list of (enqueuedAt, inputIds, future)
+        self.unprepared = [] ## (enqueuedAt, text, future) not tokenized yet, done by the model workers
+        self.condition = threading.Condition()
+        self.closed = False
+
+        ## model worker threads
+        self.threads = [threading.Thread(target=self.run, name=f"summariser-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    ## add a document and get a future for its summary
+    def submit(self, text):
+        future = Future()
+        if not isinstance(text, str) or not text.strip():
+            print("The input text is error or invalid.")
+            future.set_result("")
+            return future
+
+        ## tokenized on a model worker, submit is called from pool callbacks that should not wait for it
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("MicroBatcher is closed.")
+            self.unprepared.append((time.monotonic(), text, future))
+            self.condition.notify()
+        return future
+
+    ## tokenize submitted documents and add them to their length buckets
+    def prepare(self, items):
+        prepared = []
+        for enqueuedAt, text, future in items:
+            try:
+                mode, inputIds = prepareDocument(text, self.maxInputLength)
+                if mode == "mapReduce":
+                    self.startMapReduce(inputIds, future)
+                    continue
+            except Exception as e:
+                logging.error(f"Error preparing a document for summarisation: {e}")
+                future.set_result("") ## same as summariseText on failure
+                continue
+            prepared.append((summaryLengths(len(inputIds)), (enqueuedAt, inputIds, future)))
+        self.enqueue(prepared)
+
+    ## add (bucket, (enqueuedAt, inputIds, future)) items to the pending buckets
+    def enqueue(self, items):
+        with self.condition:
+            for bucket, item in items:
+                self.pending.setdefault(bucket, []).append(item)
+            self.condition.notify_all()
+
+    ## start map reducing a long document, its windows and reduce steps go through the pending buckets
+    def startMapReduce(self, windows, future):
+        print(f"Document longer than {self.maxInputLength} tokens, using map reduce summarisation")
+        state = MapReduceState(windows, self.maxInputLength, self.batchSize)
+        with state.lock:
+            self.enqueueRequests(state, future, state.advance())
+
+    ## queue the requests of a map reduce document, each with its own future that feeds the result back
+    def enqueueRequests(self, state, future, requests):
+        items = []
+        for lengths, inputIds, key in requests:
+            requestFuture = Future()
+            requestFuture.add_done_callback(lambda f, key=key: self.onMapReduceResult(state, future, key, f))
+            items.append((lengths, (time.monotonic(), inputIds, requestFuture)))
+        self.enqueue(items)
+
+    ## a window or reduce step of a map reduce document finished, runs on the model worker that set it
+    def onMapReduceResult(self, state, future, key, requestFuture):
+        with state.lock:
+            if future.done():
+                return ## an earlier step failed
+            try:
+                summary = requestFuture.result()
+                if not summary:
+                    raise ValueError("a map reduce step got an empty summary")
+                requests = state.onResult(key, summary)
+            except Exception as e:
+                logging.error(f"Error during map reduce summarisation: {e}")
+                future.set_result("") ## same as summariseText on failure
+                return
+            if state.summary is not None:
+                future.set_result(state.summary)
+                return
+            self.enqueueRequests(state, future, requests)
+
+    ## pick the next bucket to flush, called with the condition held
+    def nextBatch(self):
+        now = time.monotonic()
+        for bucket, items in self.pending.items():
+            if len(items) >= self.batchSize or now-items[0][0] >= self.maxWait or self.closed:
+                batch = items[:self.batchSize]
+                del items[:self.batchSize]
+                if not items:
+                    del self.pending[bucket]
+                return bucket, batch
+        return None, None
+
+    ## time until the oldest pending document expires, called with the condition held
+    def waitTime(self):
+        if not self.pending:
+            return None
+        oldest = min(items[0][0] for items in self.pending.values())
+        return max(0, oldest+self.maxWait-time.monotonic())
+
+    ## model worker loop
+    def run(self):
+        while True:
+            with self.condition:
+                items, self.unprepared = self.unprepared, []
+                bucket, batch = (None, None) if items else self.nextBatch()
+                while not items and batch is None:
+                    if self.closed and not self.pending:
+                        return
+                    self.condition.wait(self.waitTime())
+                    items, self.unprepared = self.unprepared, []
+                    bucket, batch = (None, None) if items else self.nextBatch()
+
+            if items:
+                self.prepare(items)
+                continue
+            try:
+                summaries = generateSummaries([ids for enqueuedAt, ids, future in batch], *bucket)
+                for (enqueuedAt, ids, future), summary in zip(batch, summaries):
+                    future.set_result(summary)
+            except Exception as e:
+                logging.error(f"Error during batched summarisation of {len(batch)} documents: {e}")
+                for enqueuedAt, ids, future in batch:
+                    future.set_result("") ## same as summariseText on failure
+
+    ## flush everything still pending and stop the workers
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
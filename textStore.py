@@ -0,0 +1,139 @@
+import zlib
+import hashlib
+import threading
+import logging
+from bson import Binary
+from database import getDatabase, getCollection
+from config import textCompression, textCompressionLevel, gridfsThreshold ## importing from config.py
+
+## extracted text is stored compressed instead of as a plain string:
+## {"codec": "zstd"|"zlib", "size": bytes before compression, "data": Binary} inline, or
+## {"codec": ..., "size": ..., "gridfsId": ObjectId} in the "texts" GridFS bucket above gridfsThreshold.
+## GridFS files are named by the sha256 of the text and shared by every document with that text, they are never
+## deleted on write because older documents (e.g. earlier inserts of the same url) may still point at them.
+## documents written before keep their plain string text, decodeText reads both.
+
+## queries that do not need the text leave it out
+defaultProjection = {"text": 0}
+
+gridfsBucket = None
+gridfsLock = threading.Lock()
+zstdMissingLogged = False
+
+
+## function returning the GridFS bucket for large texts
+def getGridfs():
+    global gridfsBucket
+    with gridfsLock:
+        if gridfsBucket is None:
+            import gridfs ## ships with pymongo
+            gridfsBucket = gridfs.GridFS(getDatabase(), collection="texts")
+    return gridfsBucket
+
+
+## function to compress bytes, returns (codec, compressed)
+def compress(data, codec=textCompression, level=textCompressionLevel):
+    global zstdMissingLogged
+    if codec == "zstd":
+        try:
+            import zstandard ## optional, pip install zstandard
+            return "zstd", zstandard.ZstdCompressor(level=level).compress(data)
+        except ImportError:
+            if not zstdMissingLogged:
+                logging.warning("zstandard is not installed, compressing text with zlib.")
+                zstdMissingLogged = True
+    return "zlib", zlib.compress(data, min(level, 9))
+
+
+def decompress(codec, data):
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+## function to turn extracted text into the value stored in the "text" field
+def encodeText(text, key=None):
+    """
+    key (file path or url) is kept as the source of a new GridFS file, the file itself is found by the text's hash.
+    returns the plain text when textCompression is None.
+    """
+    if not textCompression or text is None:
+        return text
+
+    raw = text.encode("utf-8")
+    codec, compressed = compress(raw)
+    if gridfsThreshold is not None and len(compressed) > gridfsThreshold:
+        bucket = getGridfs()
+        textHash = hashlib.sha256(raw).hexdigest()
+        existing = bucket.find_one({"filename": textHash, "codec": codec})
+        if existing is not None:
+            return {"codec": codec, "size": len(raw), "gridfsId": existing._id} ## same text stored before
+        fileId = bucket.put(compressed, filename=textHash, codec=codec, source=key)
+        return {"codec": codec, "size": len(raw), "gridfsId": fileId}
+    return {"codec": codec, "size": len(raw), "data": Binary(compressed)}
+
+
+## function to read the "text" field back as a string
+def decodeText(value):
+    if value is None or isinstance(value, str):
+        return value ## plain text of older documents
+    if "gridfsId" in value:
+        data = getGridfs().get(value["gridfsId"]).read()
+    else:
+        data = bytes(value["data"])
+    return decompress(value["codec"], data).decode("utf-8")
+
+
+## class decompressing a stored text on first access
+class LazyText:
+    """
+    example(how to use):
+    document = findDocument({"filePath": filePath}, withText=True)
+    print(document["text"].size) ## no decompression
+    print(str(document["text"])) ## decompressed once, then kept
+    """
+    def __init__(self, value):
+        self.stored = value
+        self.text = None
+
+    @property
+    def size(self):
+        if isinstance(self.stored, str):
+            return len(self.stored.encode("utf-8"))
+        return self.stored["size"] if self.stored else 0
+
+    @property
+    def value(self):
+        if self.text is None:
+            self.text = decodeText(self.stored)
+        return self.text
+
+    def __str__(self):
+        return self.value
+
+
+## function to find processed documents, without their text unless withText is set
+def findDocuments(filterDoc=None, projection=None, withText=False, collection=None, **kwargs):
+    """
+    yields documents, with withText their "text" is a LazyText.
+    extra keyword arguments (sort, limit, ...) are passed to find.
+    """
+    collection = collection if collection is not None else getCollection()
+    if projection is None and not withText:
+        projection = defaultProjection
+    for document in collection.find(filterDoc or {}, projection, **kwargs):
+        if withText and "text" in document:
+            document["text"] = LazyText(document["text"])
+        yield document
+
+
+def findDocument(filterDoc, projection=None, withText=False, collection=None):
+    return next(findDocuments(filterDoc, projection, withText, collection, limit=1), None)
+
+
+## function to read the text of one document as a string, None when it has none
+def getText(filterDoc, collection=None):
+    collection = collection if collection is not None else getCollection()
+    document = collection.find_one(filterDoc, {"_id": 0, "text": 1})
+    return decodeText(document.get("text")) if document else None
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import threading
+import logging
+from config import watchDebounce, watchPollInterval, watchUsePolling ## importing from config.py
+from metrics import recordStage
+from scheduler import AdmissionController, iterPdfFiles
+
+## daemon processing pdfs as they arrive in a folder
+## usage: python watchFolder.py <folder>
+## files are picked up through watchdog filesystem events, or by polling the folder when watchdog is
+## not available (or watchUsePolling is set, e.g. for network shares that do not deliver events).
+## a file is submitted once it stopped changing for watchDebounce seconds, so half copied files are not read.
+
+
+## class debouncing file events and submitting settled pdfs to the pipeline engine
+class FolderWatcher:
+    """
+    only new or changed files are processed: a file is submitted when its (size, mtime) differs from the
+    last submission, and the engine's journal skips content that was already processed.
+    the time from a file's first event to its document being written is recorded as the
+    "arrivalToCommit" stage histogram (metrics.py).
+    example(how to use):
+    with PipelineEngine() as engine:
+        FolderWatcher(folderPath, engine).run() ## until interrupted
+    """
+    def __init__(self, folderPath, engine, controller=None, debounce=watchDebounce, pollInterval=watchPollInterval,
+                 usePolling=watchUsePolling):
+        self.folderPath = folderPath
+        self.engine = engine
+        self.controller = controller or AdmissionController()
+        self.debounce = debounce
+        self.pollInterval = pollInterval
+        self.usePolling = usePolling
+        self.pending = {} ## path -> (arrivedAt, lastEventAt, size) of files still settling
+        self.submitted = {} ## path -> (size, mtime) of the last submission
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.processed = 0
+        self.failed = 0
+
+    ## record a create/modify/move event of a path
+    def onEvent(self, filePath):
+        if not filePath.lower().endswith(".pdf"):
+            return
+        try:
+            size = os.path.getsize(filePath) ## compared once debounce passed, so a quiet file settles after one wait
+        except OSError:
+            size = None ## not there (yet), checked again once debounce passed
+        now = time.monotonic()
+        with self.lock:
+            arrivedAt = self.pending[filePath][0] if filePath in self.pending else now
+            self.pending[filePath] = (arrivedAt, now, size)
+
+    ## polling fallback, compares the folder listing against the last submissions
+    def poll(self):
+        for filePath in iterPdfFiles(self.folderPath):
+            try:
+                stat = os.stat(filePath)
+            except OSError:
+                continue ## removed while listing
+            with self.lock:
+                known = self.submitted.get(filePath) == (stat.st_size, stat.st_mtime)
+            if not known:
+                self.onEvent(filePath)
+
+    ## files whose last event is older than debounce and whose size did not change since the last check
+    def settledFiles(self):
+        now = time.monotonic()
+        settled = []
+        with self.lock:
+            for filePath, (arrivedAt, lastEventAt, lastSize) in list(self.pending.items()):
+                if now-lastEventAt < self.debounce:
+                    continue
+                try:
+                    stat = os.stat(filePath)
+                except OSError:
+                    del self.pending[filePath] ## deleted or moved away before it settled
+                    continue
+                if stat.st_size != lastSize:
+                    self.pending[filePath] = (arrivedAt, now, stat.st_size) ## still growing, check again later
+                    continue
+                del self.pending[filePath]
+                if self.submitted.get(filePath) == (stat.st_size, stat.st_mtime):
+                    continue ## event without a change, e.g. a metadata touch
+                self.submitted[filePath] = (stat.st_size, stat.st_mtime)
+                settled.append((filePath, arrivedAt, stat.st_size))
+        return settled
+
+    ## submit a settled file through the admission controller
+    def submit(self, filePath, arrivedAt, size):
+        self.controller.acquire(size)
+        try:
+            future = self.engine.submitPdf(filePath)
+        except Exception as e:
+            self.controller.release(size)
+            logging.error(f"Error submitting {filePath}: {e}")
+            return
+        future.add_done_callback(lambda f: self.onDone(filePath, arrivedAt, size, f))
+
+    def onDone(self, filePath, arrivedAt, size, future):
+        self.controller.release(size)
+        latency = time.monotonic()-arrivedAt
+        try:
+            future.result()
+            recordStage("arrivalToCommit", latency)
+            self.processed += 1
+            logging.info(f"Processed {filePath} {latency:.2f} seconds after it arrived.")
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Error processing {filePath}: {e}")
+
+    ## start watchdog, returns the observer or None when polling
+    def startObserver(self):
+        if self.usePolling:
+            return None
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            logging.warning("watchdog is not installed, polling the folder instead.")
+            return None
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.onEvent(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.onEvent(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    watcher.onEvent(event.dest_path)
+
+        observer = Observer()
+        observer.schedule(Handler(), self.folderPath, recursive=False)
+        observer.start()
+        return observer
+
+    ## watch until interrupted or stop() is called
+    def run(self):
+        observer = self.startObserver()
+        logging.info(f"Watching {self.folderPath} ({'watchdog events' if observer else 'polling'}), debounce {self.debounce} seconds.")
+        self.poll() ## files already in the folder, the journal skips the processed ones
+        lastPoll = time.monotonic()
+        try:
+            while not self.stopped.wait(min(self.debounce, self.pollInterval)/2):
+                if observer is None and time.monotonic()-lastPoll >= self.pollInterval:
+                    self.poll()
+                    lastPoll = time.monotonic()
+                for filePath, arrivedAt, size in self.settledFiles():
+                    self.submit(filePath, arrivedAt, size)
+        except KeyboardInterrupt:
+            logging.info("Stopping folder watcher.")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+        logging.info(f"Folder watcher stopped, {self.processed} processed, {self.failed} failed.")
+
+    def stop(self):
+        self.stopped.set()
+
+
+## function to run the watch folder daemon with a warmed up pipeline
+def watchFolder(folderPath):
+    from parsing import warmUp
+    from engine import PipelineEngine
+    warmUp() ## the first file does not wait for the model to load
+    with PipelineEngine() as engine:
+        FolderWatcher(folderPath, engine).run()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or not os.path.isdir(sys.argv[1]):
+        sys.exit("usage: python watchFolder.py <folder>")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s) - %(levelname)s - %(message)s')
+    watchFolder(sys.argv[1])
@@ -0,0 +1,231 @@
+import os
+import sys
+import socket
+import argparse
+import datetime
+import threading
+import logging
+from concurrent.futures import Future
+from pymongo import ReturnDocument, UpdateOne, ASCENDING
+from database import getQueueCollection
+from manifest import iterManifest, classifyEntry
+from scheduler import iterPdfFiles
+from config import leaseSeconds, heartbeatInterval, maxAttempts, queuePollInterval, workerConcurrency ## importing from config.py
+
+## multi-node mode: producers enqueue documents into a mongodb collection and any number of workers,
+## on any machine reaching mongoUri, claim them with leases.
+## local pdf paths have to be readable from every worker node (e.g. a shared folder).
+## usage:
+##   python workQueue.py enqueue <folder or manifest>
+##   python workQueue.py work [--worker-id node1] [--concurrency 16] [--exit-when-empty]
+##   python workQueue.py status
+## queue item: {"source", "kind": "pdf"|"url", "status": "queued"|"leased"|"done"|"failed", "attempts",
+##              "workerId", "leaseExpiresAt", "enqueuedAt", "finishedAt", "error"}
+## times are utc, so nodes in different time zones agree on when a lease expires.
+
+
+## function returning the current time in utc
+def utcNow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+## function to create the indexes claims and enqueues rely on
+def ensureQueueIndexes(collection=None):
+    collection = collection if collection is not None else getQueueCollection()
+    collection.create_index([("source", ASCENDING)], unique=True) ## enqueueing the same source twice is a no-op
+    collection.create_index([("status", ASCENDING), ("leaseExpiresAt", ASCENDING), ("enqueuedAt", ASCENDING)])
+
+
+## function to enqueue ("pdf"|"url", source) jobs in batches, returns the number of new items
+def enqueueJobs(jobs, collection=None, batchSize=1000):
+    collection = collection if collection is not None else getQueueCollection()
+    ensureQueueIndexes(collection)
+    inserted = 0
+    batch = []
+
+    def write():
+        nonlocal inserted, batch
+        if batch:
+            result = collection.bulk_write(batch, ordered=False)
+            inserted += result.upserted_count
+            batch = []
+
+    for kind, source in jobs:
+        item = {"source": source, "kind": kind, "status": "queued", "attempts": 0, "enqueuedAt": utcNow()}
+        batch.append(UpdateOne({"source": source}, {"$setOnInsert": item}, upsert=True))
+        if len(batch) >= batchSize:
+            write()
+    write()
+    logging.info(f"Enqueued {inserted} new items.")
+    return inserted
+
+
+## function to turn a folder or a JSON manifest into jobs, lazily
+def iterSourceJobs(path):
+    if os.path.isdir(path):
+        for filePath in iterPdfFiles(path):
+            yield "pdf", os.path.abspath(filePath)
+        return
+
+    for key, item in iterManifest(path):
+        kind = classifyEntry(item)
+        if kind is None:
+            logging.warning(f"Invalid entry in json {key} -> {item}")
+            continue
+        yield kind, (os.path.abspath(item) if kind == "pdf" else item)
+
+
+## class claiming queue items with leases and running them on a pipeline engine
+class QueueWorker:
+    """
+    claims are atomic find_one_and_update calls, so two workers never run the same item.
+    a heartbeat thread renews the leases of running items, items of a crashed worker are claimed
+    again once their lease expires. a failed item goes back to the queue until it was tried maxAttempts times,
+    an item whose lease expires on its last attempt is marked failed.
+    example(how to use):
+    QueueWorker().run(exitWhenEmpty=True)
+    """
+    def __init__(self, workerId=None, concurrency=workerConcurrency, collection=None):
+        self.workerId = workerId or f"{socket.gethostname()}-{os.getpid()}"
+        self.collection = collection if collection is not None else getQueueCollection()
+        self.slots = threading.Semaphore(concurrency)
+        self.running = {} ## _id -> item of claimed items not finished yet
+        self.runningLock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeatThread = threading.Thread(target=self.heartbeat, name="heartbeat", daemon=True)
+        self.completed = 0
+        self.failed = 0
+
+    ## claim the oldest queued item, or an item whose lease expired
+    def claim(self):
+        now = utcNow()
+        return self.collection.find_one_and_update(
+            {"$or": [{"status": "queued"}, {"status": "leased", "leaseExpiresAt": {"$lt": now}}],
+             "attempts": {"$lt": maxAttempts}},
+            {"$set": {"status": "leased", "workerId": self.workerId, "leaseExpiresAt": now+datetime.timedelta(seconds=leaseSeconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("enqueuedAt", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    ## mark items whose lease expired on their last attempt as failed, claim no longer picks them up
+    def failExpired(self):
+        now = utcNow()
+        result = self.collection.update_many(
+            {"status": "leased", "leaseExpiresAt": {"$lt": now}, "attempts": {"$gte": maxAttempts}},
+            {"$set": {"status": "failed", "finishedAt": now, "error": "lease expired on the last attempt"}}
+        )
+        if result.modified_count:
+            logging.warning(f"Marked {result.modified_count} items failed, their worker stopped during the last attempt.")
+
+    ## renew the leases of running items until the worker stops
+    def heartbeat(self):
+        while not self.stopped.wait(heartbeatInterval):
+            with self.runningLock:
+                ids = list(self.running)
+            if not ids:
+                continue
+            try:
+                leaseExpiresAt = utcNow()+datetime.timedelta(seconds=leaseSeconds)
+                self.collection.update_many({"_id": {"$in": ids}, "workerId": self.workerId, "status": "leased"},
+                                            {"$set": {"leaseExpiresAt": leaseExpiresAt}})
+            except Exception as e:
+                logging.error(f"Error renewing leases of worker {self.workerId}: {e}") ## retried on the next beat
+
+    ## record the outcome of an item, failures are queued again until maxAttempts
+    def complete(self, item, future):
+        with self.runningLock:
+            self.running.pop(item["_id"], None)
+        self.slots.release()
+
+        update = {"finishedAt": utcNow()}
+        try:
+            future.result()
+            update["status"] = "done"
+            self.completed += 1
+        except Exception as e:
+            logging.error(f"Error processing {item['source']} (attempt {item['attempts']}): {e}")
+            update["status"] = "queued" if item["attempts"] < maxAttempts else "failed"
+            update["error"] = str(e)
+            self.failed += 1
+
+        try:
+            ## the filter on workerId keeps a worker whose lease expired from overwriting the new owner
+            self.collection.update_one({"_id": item["_id"], "workerId": self.workerId}, {"$set": update})
+        except Exception as e:
+            logging.error(f"Error recording the result of {item['source']}: {e}") ## the lease expires and the item is retried
+
+    ## claim and run items until stopped, or until the queue is empty with exitWhenEmpty
+    def run(self, exitWhenEmpty=False):
+        from parsing import warmUp ## imported here so enqueue and status do not load the pipeline
+        from engine import PipelineEngine
+
+        ensureQueueIndexes(self.collection)
+        warmUp() ## load the model before claiming, so leases are not spent on start up
+        self.heartbeatThread.start()
+        logging.info(f"Worker {self.workerId} started.")
+
+        try:
+            with PipelineEngine() as engine:
+                while not self.stopped.is_set():
+                    self.slots.acquire() ## wait for a free slot before claiming
+                    item = self.claim()
+                    if item is None:
+                        self.slots.release()
+                        self.failExpired()
+                        with self.runningLock:
+                            idle = not self.running
+                        if exitWhenEmpty and idle:
+                            break
+                        self.stopped.wait(queuePollInterval)
+                        continue
+
+                    with self.runningLock:
+                        self.running[item["_id"]] = item
+                    try:
+                        future = engine.submitPdf(item["source"]) if item["kind"] == "pdf" else engine.submitUrl(item["source"])
+                    except Exception as e:
+                        future = Future() ## recorded like any other failure
+                        future.set_exception(e)
+                    future.add_done_callback(lambda f, item=item: self.complete(item, f))
+        except KeyboardInterrupt:
+            logging.info(f"Worker {self.workerId} interrupted, unfinished items are reclaimed once their lease expires.")
+        finally:
+            self.stopped.set()
+        logging.info(f"Worker {self.workerId} stopped, {self.completed} items done, {self.failed} failed.")
+
+    def stop(self):
+        self.stopped.set()
+
+
+## function returning the number of queue items per status
+def queueStatus(collection=None):
+    collection = collection if collection is not None else getQueueCollection()
+    return {row["_id"]: row["count"] for row in collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-node pipeline workers on a MongoDB work queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueueParser = commands.add_parser("enqueue", help="enqueue the pdfs of a folder or the entries of a JSON manifest")
+    enqueueParser.add_argument("path")
+    workParser = commands.add_parser("work", help="claim and process queued items")
+    workParser.add_argument("--worker-id", default=None, help="defaults to <hostname>-<pid>")
+    workParser.add_argument("--concurrency", type=int, default=workerConcurrency, help="items processed at once")
+    workParser.add_argument("--exit-when-empty", action="store_true", help="stop once the queue is empty")
+    commands.add_parser("status", help="print the number of items per status")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s) - %(levelname)s - %(message)s')
+    if args.command == "enqueue":
+        if not os.path.exists(args.path):
+            sys.exit(f"No such folder or manifest: {args.path}")
+        enqueueJobs(iterSourceJobs(args.path))
+    elif args.command == "work":
+        QueueWorker(args.worker_id, args.concurrency).run(args.exit_when_empty)
+    else:
+        print(queueStatus())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import os
+import time
+import itertools
+import threading
+import logging
+import multiprocessing
+import psutil
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from metrics import incrementCounter
+from config import workerMaxTasks, workerRecycleRss, documentRssLimit, documentTimeout ## importing from config.py
+
+## queue of the worker processes, tells the parent which task a worker started and when
+workerStartedQueue = None
+
+
+## raised for a document that went over a cap twice, the second time alone in a fresh worker
+class ResourceCapExceeded(Exception):
+    pass
+
+
+## function run once in every worker process
+def initWorker(startedQueue):
+    global workerStartedQueue
+    workerStartedQueue = startedQueue
+
+
+## function to measure the memory of a worker, its uss
+def workerMemory(process):
+    """
+    forked workers share the parent's pages (the summariser model loaded by warmUp among them) copy on write,
+    their rss counts those pages although killing or recycling the worker frees none of them.
+    uss counts only the pages the worker does not share, so it is what the worker holds on its own.
+    """
+    return process.memory_full_info().uss
+
+
+## function wrapping every task in the worker, returns the result and the worker's uss afterwards
+def runTask(taskId, fn, args, kwargs):
+    workerStartedQueue.put((taskId, os.getpid(), time.monotonic()))
+    result = fn(*args, **kwargs)
+    return result, workerMemory(psutil.Process())
+
+
+## class holding one submitted task
+class PoolTask:
+    def __init__(self, taskId, fn, args, kwargs):
+        self.taskId = taskId
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future() ## what the caller gets, survives resubmission to a new pool
+        self.isolated = False ## retried alone in a fresh worker
+        self.pid = None
+        self.startedAt = None
+        self.killedFor = None ## reason the worker running this task was killed
+        self.resubmits = 0 ## times the task's pool broke while it was running
+
+
+## process pool that recycles its workers and isolates documents going over memory or time caps
+class RecyclingPool:
+    """
+    drop-in for the engine's ProcessPoolExecutor (submit and shutdown).
+    the pool is replaced by a fresh one once a worker has run maxTasks tasks or its uss (memory not
+    shared with the parent, see workerMemory) after a task is above recycleRss, so memory that fitz, tesseract
+    or torch do not give back is returned to the os.
+    the old pool finishes its queued tasks and exits.
+    a worker whose task runs longer than timeout or its uss grows above rssLimit is killed. that breaks its pool,
+    so the other tasks of the pool are resubmitted to a new one, and the task itself is retried once alone
+    in a fresh single worker pool before its future fails with ResourceCapExceeded. a task that was running
+    when its pool broke twice without a kill (e.g. a segfault in a native library) is isolated the same way.
+    recycles, kills and retries are counted in the metrics (workerRecycled, workerKilled, isolatedRetry, ...).
+    example(how to use):
+    pool = RecyclingPool(maxWorkers=4)
+    future = pool.submit(extractPdf, filePath)
+    pool.shutdown()
+    """
+    def __init__(self, maxWorkers=None, maxTasks=workerMaxTasks, recycleRss=workerRecycleRss, rssLimit=documentRssLimit,
+                 timeout=documentTimeout, checkInterval=0.5):
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.maxTasks = maxTasks
+        self.recycleRss = recycleRss
+        self.rssLimit = rssLimit
+        self.timeout = timeout
+        self.checkInterval = checkInterval
+        self.startedQueue = multiprocessing.SimpleQueue() ## written straight to the pipe, a crashing worker can not lose it
+        self.startedLock = threading.Lock()
+        self.taskIds = itertools.count()
+        self.tasks = {} ## taskId -> PoolTask not finished yet
+        self.taskCounts = {} ## pid -> tasks finished by that worker
+        self.lock = threading.RLock()
+        self.executor = self.newExecutor(self.maxWorkers)
+        self.stopped = threading.Event()
+        self.monitorThread = threading.Thread(target=self.monitor, name="pool-monitor", daemon=True)
+        self.monitorThread.start()
+
+    def newExecutor(self, workers):
+        return ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(self.startedQueue,))
+
+    ## submit fn(*args, **kwargs) to a worker, returns a future like ProcessPoolExecutor.submit
+    def submit(self, fn, *args, **kwargs):
+        task = PoolTask(next(self.taskIds), fn, args, kwargs)
+        with self.lock:
+            self.tasks[task.taskId] = task
+        self.dispatch(task)
+        return task.future
+
+    def dispatch(self, task):
+        while True:
+            with self.lock:
+                ## an isolated retry gets a worker of its own, so it can not take other documents down with it
+                executor = self.newExecutor(1) if task.isolated else self.executor
+                task.pid = task.startedAt = None
+                try:
+                    inner = executor.submit(runTask, task.taskId, task.fn, task.args, task.kwargs)
+                    break
+                except BrokenProcessPool:
+                    pass ## a worker was just killed and its pool not replaced yet
+            self.replaceExecutor(executor)
+        inner.add_done_callback(lambda f: self.onTaskDone(task, executor, f))
+
+    ## swap out a pool, the old one finishes what it has queued (unless it is broken) and exits
+    def replaceExecutor(self, old):
+        with self.lock:
+            if old is self.executor:
+                self.executor = self.newExecutor(self.maxWorkers)
+            else:
+                return False ## already replaced by another task of the same pool, or an isolated pool
+        old.shutdown(wait=False)
+        return True
+
+    def onTaskDone(self, task, executor, inner):
+        self.drainStarted()
+        if task.isolated:
+            executor.shutdown(wait=False)
+        try:
+            result, uss = inner.result()
+        except BrokenProcessPool:
+            self.replaceExecutor(executor)
+            if task.killedFor is None and not task.isolated and task.resubmits < 2:
+                ## collateral of another task's kill or a crashed worker, only tasks that were running are suspects
+                incrementCounter("resubmitted")
+                if task.pid is not None:
+                    task.resubmits += 1
+                self.dispatch(task)
+            elif not task.isolated:
+                logging.warning(f"Retrying task {task.taskId} alone in a fresh worker after {task.killedFor or 'its worker crashed'}.")
+                incrementCounter("isolatedRetry")
+                task.isolated = True
+                task.killedFor = None
+                self.dispatch(task)
+            else:
+                incrementCounter("isolatedFailed")
+                self.finish(task, exception=ResourceCapExceeded(f"{task.killedFor or 'worker crashed'} in a fresh worker as well"))
+            return
+        except Exception as e:
+            self.finish(task, exception=e)
+            return
+
+        self.finish(task, result=result)
+        self.checkRecycle(executor, task.pid, uss)
+
+    def finish(self, task, result=None, exception=None):
+        with self.lock:
+            self.tasks.pop(task.taskId, None)
+        if exception is not None:
+            task.future.set_exception(exception)
+        else:
+            task.future.set_result(result)
+
+    ## recycle the pool when the worker that ran a task has done enough tasks or grew too large
+    def checkRecycle(self, executor, pid, uss):
+        if executor is not self.executor:
+            return ## isolated or already replaced pools are not recycled
+        with self.lock:
+            count = 0
+            if pid is not None:
+                count = self.taskCounts[pid] = self.taskCounts.get(pid, 0)+1
+            reason = None
+            if self.maxTasks and count >= self.maxTasks:
+                reason = f"{count} tasks"
+            elif self.recycleRss and uss >= self.recycleRss:
+                reason = f"uss {uss/1024/1024:.0f}MB"
+            if reason is None or not self.replaceExecutor(executor):
+                return
+            self.taskCounts.clear()
+        logging.info(f"Recycled extraction workers after a worker reached {reason}.")
+        incrementCounter("workerRecycled")
+
+    ## read the started notifications of the workers
+    def drainStarted(self):
+        with self.startedLock:
+            while not self.startedQueue.empty():
+                taskId, pid, startedAt = self.startedQueue.get()
+                with self.lock:
+                    task = self.tasks.get(taskId)
+                    if task is not None:
+                        task.pid, task.startedAt = pid, startedAt
+
+    ## background thread killing workers whose running task went over the time or memory cap
+    def monitor(self):
+        while not self.stopped.wait(self.checkInterval):
+            self.drainStarted()
+            if not self.timeout and not self.rssLimit:
+                continue
+            now = time.monotonic()
+            with self.lock:
+                running = [task for task in self.tasks.values() if task.pid and task.killedFor is None]
+            for task in running:
+                reason = None
+                try:
+                    if self.timeout and now-task.startedAt > self.timeout:
+                        reason = f"running over {self.timeout} seconds"
+                    elif self.rssLimit and workerMemory(psutil.Process(task.pid)) > self.rssLimit:
+                        reason = f"uss over {self.rssLimit/1024/1024:.0f}MB"
+                    if reason:
+                        task.killedFor = reason
+                        logging.warning(f"Killing worker {task.pid} of task {task.taskId}, {reason}.")
+                        psutil.Process(task.pid).kill()
+                        incrementCounter("workerKilled")
+                except psutil.Error:
+                    pass ## worker already exited
+
+    ## wait for submitted tasks and stop every pool
+    def shutdown(self, wait=True):
+        if wait:
+            while True:
+                with self.lock:
+                    pending = [task.future for task in self.tasks.values()]
+                if not pending:
+                    break
+                for future in pending:
+                    future.exception() ## waits without raising, resubmissions keep the same future
+        self.stopped.set()
+        with self.lock:
+            executor = self.executor
+        executor.shutdown(wait=wait)